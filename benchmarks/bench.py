@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+# build benchmarks on synthetic sites.
+#
+#   python -m benchmarks.bench --pages 500 --converter standin -o after.json --compare before.json
+#
+# scenarios, each one is a fresh Site (scan included) and Site.generate like a cli run:
+#   cold      empty output directory and conversion cache
+#   noop      nothing changed since the last build
+#   edit      one markdown page changed
+#   template  markdown.j2.html changed, all markdown pages are rendered again
+#
+# the stand-in converter turns markdown into html in python, so that the rest of the
+# pipeline can be measured without pandoc and without its noise.
+
+import os, re, io, sys, json, time, random, platform, statistics, subprocess, contextlib
+from html import escape
+from pathlib import Path
+from .synth import SiteSpec, make_site, FEATURES
+
+SCENARIOS = ['cold', 'noop', 'edit', 'template']
+
+def load_sitegen():
+    from sitegen import sitegen
+    return sitegen
+
+def standin_pandoc(sitegen, delay=0.0):
+    class StandinPandoc(sitegen.Pandoc):
+        "markdown -> standalone html5 in python. delay (seconds) emulates the latency of a converter process."
+        R_HEADING = re.compile(r'^(#{1,6})\s+(.*)$')
+        R_LINK = re.compile(r'\[([^\]]*)\]\(([^)]*)\)')
+
+        def __init__(self):
+            self.src_fmts = ['markdown']
+            self.dst_fmts = ['html5']
+            self.version = 'standin'
+
+        def convert(self, src, src_format, dst_format, extra_args=[], cwd=None):
+            self.check_format(src_format, dst_format)
+            if delay:
+                time.sleep(delay)
+            text = src.decode(sitegen.PAGE_ENCODING) if isinstance(src, bytes) else src
+            return self.html(text), ''
+
+        def inline(self, s):
+            return self.R_LINK.sub(lambda m: f'<a href="{escape(m[2])}">{m[1]}</a>', escape(s, quote=False))
+
+        def html(self, text):
+            out = []
+            for n, block in enumerate(re.split(r'\n\s*\n', text.strip())):
+                lines = block.splitlines()
+                m = self.R_HEADING.match(block)
+                if m:
+                    level = len(m[1])
+                    out.append(f'<h{level} id="h{n}">{self.inline(m[2])}</h{level}>')
+                elif block.startswith('|'):
+                    rows = [l.strip('|').split('|') for l in lines if not l.startswith('|---')]
+                    out.append('<table>' + ''.join('<tr>' + ''.join(f'<td>{self.inline(c.strip())}</td>' for c in r) + '</tr>' for r in rows) + '</table>')
+                elif block.startswith('```'):
+                    out.append(f'<pre><code>{escape(chr(10).join(lines[1:-1]))}</code></pre>')
+                elif block.startswith('$$'):
+                    out.append(f'<p><span class="math display">\\[{escape(block.strip("$").strip())}\\]</span></p>')
+                else:
+                    out.append(f'<p>{self.inline(block)}</p>')
+            body = '\n'.join(out)
+            return f'<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8" />\n</head>\n<body>\n{body}\n</body>\n</html>\n'
+    return StandinPandoc()
+
+@contextlib.contextmanager
+def chdir(path):
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).resolve().parent,
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return out.stdout.decode().strip() or None
+    except OSError:
+        return None
+
+class Bench:
+    def __init__(self, root, spec, converter='standin', delay=0.0, jobs=None, batch_size=None, hash_mode=False, quiet=True, stream=False):
+        self.root = Path(root).resolve()
+        self.spec = spec
+        self.sitegen = load_sitegen()
+        if converter == 'standin':
+            self.sitegen.pandoc = standin_pandoc(self.sitegen, delay)
+            batch_size = 0
+        self.converter = converter
+        self.jobs = jobs
+        self.batch_size = self.sitegen.BATCH_SIZE if batch_size is None else batch_size
+        self.hash_mode = hash_mode
+        self.stream = stream
+        self.quiet = quiet
+        self.rng = random.Random(spec.seed)
+        self.paths = make_site(self.root, spec)
+
+    def build(self):
+        "one cli-like build, return timings and counts"
+        sitegen = self.sitegen
+        stderr = io.StringIO() if self.quiet else sys.stderr
+        with chdir(self.root), contextlib.redirect_stderr(stderr):
+            t0 = time.perf_counter()
+            site = sitegen.Site('src', '_templates', '.sitegen-cache', sitegen.DEFAULT_MAX_SIZE,
+                                self.batch_size, self.hash_mode, self.jobs, stream=self.stream)
+            t1 = time.perf_counter()
+            stale = site.generate('_output', True)
+            t2 = time.perf_counter()
+        return {'total': t2 - t0, 'load': t1 - t0, 'generate': t2 - t1, 'pages': len(site.pages),
+                'rebuilt': len(stale), 'cache_hits': site.cache.hits, 'cache_misses': site.cache.misses}
+
+    def prepare(self, scenario):
+        "change the site for the next run of scenario"
+        if scenario == 'cold':
+            for d in ['_output', '.sitegen-cache']:
+                if (self.root / d).exists():
+                    self.sitegen.remove(self.root / d)
+        elif scenario == 'edit':
+            p = self.root / 'src' / self.rng.choice(self.paths)
+            with open(p, 'a') as f:
+                f.write(f'\nedited {time.time()}\n')
+        elif scenario == 'template':
+            with open(self.root / '_templates' / self.sitegen.MARKDOWN_TEMPLATE, 'a') as f:
+                f.write(f'{{# touched {time.time()} #}}\n')
+
+    def run(self, scenarios=SCENARIOS, repeat=3):
+        results = {}
+        for scenario in scenarios:
+            if scenario != 'cold' and not (self.root / '_output').exists():
+                self.build()
+            runs = []
+            for i in range(repeat):
+                self.prepare(scenario)
+                runs.append(self.build())
+            totals = [r['total'] for r in runs]
+            results[scenario] = {'min': min(totals), 'median': statistics.median(totals), 'runs': runs}
+        return results
+
+    def meta(self):
+        return {'commit': git_commit(), 'python': platform.python_version(), 'platform': platform.platform(),
+                'cpus': os.cpu_count(), 'converter': self.converter, 'converter_version': self.sitegen.pandoc.version,
+                'jobs': self.jobs, 'batch_size': self.batch_size, 'hash_mode': self.hash_mode, 'stream': self.stream,
+                'site': self.spec.as_dict()}
+
+def compare(base, new):
+    "lines comparing median times of scenarios in both results"
+    lines = [f'{"scenario":10} {"base":>10} {"new":>10} {"ratio":>7}']
+    for scenario, r in new['results'].items():
+        b = base['results'].get(scenario)
+        if b:
+            lines.append(f'{scenario:10} {b["median"]:10.3f} {r["median"]:10.3f} {r["median"]/b["median"]:7.2f}')
+    return lines
+
+def main(argv=None):
+    from argparse import ArgumentParser
+    parser = ArgumentParser(prog='python -m benchmarks.bench', description='benchmark sitegen builds on a synthetic site')
+    parser.add_argument("--root", help="directory for the synthetic site (replaced)", default='_bench')
+    parser.add_argument("--pages", type=int, help="number of markdown pages", default=200)
+    parser.add_argument("--depth", type=int, help="maximum directory depth", default=3)
+    parser.add_argument("--fanout", type=int, help="subdirectories per directory", default=4)
+    parser.add_argument("--page-size", type=int, help="approximate markdown bytes per page", default=4000)
+    parser.add_argument("--assets", type=int, help="number of static files", default=50)
+    parser.add_argument("--asset-size", type=int, help="mean static file size in bytes", default=20000)
+    parser.add_argument("--features", help="comma separated markdown features", default=','.join(FEATURES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--converter", choices=['standin', 'pandoc'], help="markdown converter", default='standin')
+    parser.add_argument("--delay", type=float, help="seconds the stand-in converter sleeps per page", default=0.0)
+    parser.add_argument("-j", "--jobs", type=int, default=None)
+    parser.add_argument("--batch", dest="batch_size", type=int, help="pandoc batch size", default=None)
+    parser.add_argument("--hash", dest="hash_mode", action='store_true')
+    parser.add_argument("--stream", action='store_true', help="build with --stream")
+    parser.add_argument("--scenario", dest="scenarios", action='append', choices=SCENARIOS, help="scenario to run (repeatable, default: all)")
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("-o", "--output", help="write json results to this file (default: stdout)")
+    parser.add_argument("--compare", metavar="BASE_JSON", help="print median ratios against earlier results")
+    parser.add_argument("-v", "--verbose", action='store_true', help="show build output")
+    args = parser.parse_args(argv)
+
+    features = [f for f in args.features.split(',') if f]
+    spec = SiteSpec(args.pages, args.depth, args.fanout, args.page_size, args.assets, args.asset_size, features, args.seed)
+    bench = Bench(args.root, spec, args.converter, args.delay, args.jobs, args.batch_size, args.hash_mode, not args.verbose, args.stream)
+    data = {'meta': bench.meta(), 'results': bench.run(args.scenarios or SCENARIOS, args.repeat)}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=1)
+    else:
+        json.dump(data, sys.stdout, indent=1)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+        for line in compare(base, data):
+            print(line, file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
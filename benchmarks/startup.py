@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+# startup benchmarks: wall time of fresh `python -m sitegen` processes.
+#
+#   python -m benchmarks.startup --pages 50 -o after.json --compare before.json
+#
+# scenarios, each one a new interpreter:
+#   python    `python -c pass`, the floor of the others
+#   import    `import sitegen.sitegen`
+#   help      `sitegen --help`
+#   noop      `sitegen src -o _output` on a synthetic site built beforehand, nothing changed
+#
+# the site is built once in-process with the stand-in converter. a no-op build does not
+# run any converter, so the real pandoc is neither needed nor measured.
+
+import os, io, sys, json, time, statistics, subprocess, contextlib
+from pathlib import Path
+from .synth import SiteSpec, make_site
+from .bench import load_sitegen, standin_pandoc, chdir, git_commit, compare
+
+SCENARIOS = ['python', 'import', 'help', 'noop']
+
+COMMANDS = {
+    'python': ['-c', 'pass'],
+    'import': ['-c', 'import sitegen.sitegen'],
+    'help': ['-m', 'sitegen', '--help'],
+    'noop': ['-m', 'sitegen', 'src', '-o', '_output', '-t', '_templates'],
+}
+
+class Startup:
+    def __init__(self, root, spec):
+        self.root = Path(root).resolve()
+        self.spec = spec
+        make_site(self.root, spec)
+        self.env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(Path(__file__).resolve().parents[1]), os.environ.get('PYTHONPATH')])))
+        # like an installed package, bytecode is compiled once by the warm-up run
+        self.env.pop('PYTHONDONTWRITEBYTECODE', None)
+
+    def build(self):
+        "first build, with the stand-in converter"
+        sitegen = load_sitegen()
+        pandoc = sitegen.pandoc
+        sitegen.pandoc = standin_pandoc(sitegen)
+        try:
+            with chdir(self.root), contextlib.redirect_stderr(io.StringIO()):
+                sitegen.Site('src', '_templates', sitegen.CACHE_DIR, batch_size=0).generate('_output', False)
+        finally:
+            sitegen.pandoc = pandoc
+
+    def time(self, scenario):
+        t0 = time.perf_counter()
+        p = subprocess.run([sys.executable] + COMMANDS[scenario], cwd=self.root, env=self.env,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        t1 = time.perf_counter()
+        if p.returncode != 0:
+            raise RuntimeError(f'{scenario} failed: {p.stderr.decode(errors="replace")}')
+        return t1 - t0
+
+    def run(self, scenarios=SCENARIOS, repeat=10):
+        if 'noop' in scenarios:
+            self.build()
+        results = {}
+        for scenario in scenarios:
+            self.time(scenario) # warm the page cache and __pycache__
+            runs = [self.time(scenario) for i in range(repeat)]
+            results[scenario] = {'min': min(runs), 'median': statistics.median(runs), 'runs': runs}
+        return results
+
+    def meta(self):
+        return {'commit': git_commit(), 'python': sys.version.split()[0], 'site': self.spec.as_dict()}
+
+def main(argv=None):
+    from argparse import ArgumentParser
+    parser = ArgumentParser(prog='python -m benchmarks.startup', description='benchmark sitegen cli startup')
+    parser.add_argument("--root", help="directory for the synthetic site (replaced)", default='_bench_startup')
+    parser.add_argument("--pages", type=int, help="number of markdown pages", default=50)
+    parser.add_argument("--scenario", dest="scenarios", action='append', choices=SCENARIOS, help="scenario to run (repeatable, default: all)")
+    parser.add_argument("-r", "--repeat", type=int, default=10)
+    parser.add_argument("-o", "--output", help="write json results to this file (default: stdout)")
+    parser.add_argument("--compare", metavar="BASE_JSON", help="print median ratios against earlier results")
+    args = parser.parse_args(argv)
+
+    spec = SiteSpec(pages=args.pages, assets=max(args.pages // 10, 1))
+    startup = Startup(args.root, spec)
+    data = {'meta': startup.meta(), 'results': startup.run(args.scenarios or SCENARIOS, args.repeat)}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=1)
+    else:
+        json.dump(data, sys.stdout, indent=1)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+        for line in compare(base, data):
+            print(line, file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+# synthetic sites for benchmarks. the same parameters and seed always make the same tree:
+#
+#   root/config.yaml
+#   root/_templates/    copy of the package templates, touched by the template scenario
+#   root/src/           markdown pages in nested directories, and static assets
+
+import os, random, shutil
+from pathlib import Path
+
+FEATURES = ['headings', 'tables', 'math', 'code', 'links']
+ASSET_KINDS = {'.css': 0.3, '.js': 0.3, '.png': 0.3, '.pdf': 0.1}
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor '
+         'incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud '
+         'exercitation ullamco laboris nisi aliquip ex ea commodo consequat').split()
+
+class SiteSpec:
+    "parameters of a synthetic site"
+    def __init__(self, pages=200, depth=3, fanout=4, page_size=4000, assets=50, asset_size=20000,
+                 features=FEATURES, seed=0):
+        self.pages = pages
+        self.depth = depth
+        self.fanout = fanout
+        self.page_size = page_size
+        self.assets = assets
+        self.asset_size = asset_size
+        self.features = list(features)
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+class Writer:
+    def __init__(self, spec, rng, links):
+        self.spec = spec
+        self.rng = rng
+        self.links = links
+
+    def sentence(self, n=12):
+        words = [self.rng.choice(WORDS) for i in range(n)]
+        if 'links' in self.spec.features and self.links and self.rng.random() < 0.2:
+            target = self.rng.choice(self.links)
+            words.insert(self.rng.randrange(len(words)), f'[{words.pop()}]({target})')
+        if 'math' in self.spec.features and self.rng.random() < 0.1:
+            words.append('$a_{%d}^2 + b^2 = c^2$' % self.rng.randrange(10))
+        return ' '.join(words).capitalize() + '.'
+
+    def paragraph(self):
+        return ' '.join(self.sentence(self.rng.randrange(6, 18)) for i in range(self.rng.randrange(2, 6)))
+
+    def table(self):
+        cols = self.rng.randrange(2, 6)
+        rows = [' | '.join(self.rng.choice(WORDS) for c in range(cols)) for r in range(self.rng.randrange(3, 10))]
+        return '\n'.join([f'| {rows[0]} |', '|' + '---|' * cols] + [f'| {r} |' for r in rows[1:]])
+
+    def block(self):
+        f = self.spec.features
+        r = self.rng.random()
+        if 'headings' in f and r < 0.15:
+            return '#' * self.rng.randrange(2, 4) + ' ' + self.sentence(3)[:-1]
+        if 'tables' in f and r < 0.22:
+            return self.table()
+        if 'math' in f and r < 0.27:
+            return '$$\n\\sum_{i=0}^{%d} x_i^2 = \\int_0^1 f(x)\\,dx\n$$' % self.rng.randrange(100)
+        if 'code' in f and r < 0.32:
+            return '```python\n' + '\n'.join(f'x{i} = {i} * {self.rng.randrange(100)}' for i in range(self.rng.randrange(2, 12))) + '\n```'
+        return self.paragraph()
+
+    def page(self, title):
+        parts = [f'# {title}']
+        size = 0
+        while size < self.spec.page_size:
+            b = self.block()
+            parts.append(b)
+            size += len(b)
+        return '\n\n'.join(parts) + '\n'
+
+def page_paths(spec, rng):
+    "relative paths of markdown pages, spread over directories up to spec.depth deep"
+    paths = []
+    for i in range(spec.pages):
+        d = rng.randrange(spec.depth + 1)
+        dirs = [f'd{rng.randrange(spec.fanout)}' for j in range(d)]
+        paths.append(Path(*dirs, f'page{i}.md'))
+    return paths
+
+def make_site(root, spec):
+    """
+    write the synthetic site of spec into root, replacing what was there.
+    return the list of markdown page paths relative to root/src.
+    """
+    root = Path(root)
+    if root.exists():
+        shutil.rmtree(root)
+    src = root / 'src'
+    src.mkdir(parents=True)
+    rng = random.Random(spec.seed)
+
+    with open(root / 'config.yaml', 'w') as f:
+        f.write('sitename: sitegen benchmark\n')
+    shutil.copytree(Path(__file__).resolve().parent.parent / 'sitegen' / 'templates', root / '_templates')
+
+    paths = page_paths(spec, rng)
+    html = [str(p.with_suffix('.html')) for p in paths]
+    for i, p in enumerate(paths):
+        # links are relative to the page, so only pages of the same directory are linked
+        siblings = [os.path.basename(h) for h in html if os.path.dirname(h) == str(p.parent)]
+        w = Writer(spec, rng, siblings)
+        (src / p.parent).mkdir(parents=True, exist_ok=True)
+        with open(src / p, 'w') as f:
+            f.write(w.page(f'Page {i}'))
+
+    kinds = list(ASSET_KINDS)
+    weights = list(ASSET_KINDS.values())
+    for i in range(spec.assets):
+        suffix = rng.choices(kinds, weights)[0]
+        size = max(1, int(rng.expovariate(1 / spec.asset_size)))
+        d = src / 'assets' / f'a{i % spec.fanout}'
+        d.mkdir(parents=True, exist_ok=True)
+        with open(d / f'asset{i}{suffix}', 'wb') as f:
+            f.write(rng.randbytes(size) if suffix in ('.png', '.pdf') else
+                    ' '.join(rng.choice(WORDS) for j in range(size // 6)).encode())
+    return paths
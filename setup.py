@@ -26,7 +26,8 @@ setup(name='sitegen',
       url='http://github.com/mizuy/sitegen',
       license='MIT',
       packages=find_packages(),
-      install_requires=['Jinja2',  'PyYAML', 'pyquery', 'tqdm'],
+      install_requires=['Jinja2',  'PyYAML', 'lxml', 'tqdm'],
+      extras_require={'citation': ['citeproc-py'], 'brotli': ['brotli'], 'minify': ['rjsmin']},
       entry_points=\
 """
 [console_scripts]
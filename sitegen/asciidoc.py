@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+# asciidoc -> standalone html5 through long-lived asciidoctor worker processes.
+# a worker is one ruby process with asciidoctor loaded, converting documents framed on
+# stdin/stdout, so that ruby and the gem are loaded once instead of once per page.
+#
+# request   "<length> <base_dir>\n" + source
+# response  "ok <length>\n" + html  or  "err <length>\n" + message
+#
+# a worker converting a document holds one of the supervisor's slots, so that the workers
+# count towards the cap on converter processes like pandoc calls do. idle workers do not.
+# a worker running over the supervisor's timeout is killed and the document retried on a
+# fresh worker. a document which times out on every try raises ConverterError, also for
+# later converts of it in this process.
+
+import os, re, queue, shutil, atexit, threading, subprocess
+from .supervisor import Supervisor, ConverterError, decode, probe_cached
+
+WORKER_RB = r"""
+require 'asciidoctor'
+$stdin.binmode
+$stdout.binmode
+while (line = $stdin.gets)
+  length, base_dir = line.chomp.split(' ', 2)
+  length = length.to_i
+  src = length > 0 ? $stdin.read(length) : ''
+  begin
+    out = Asciidoctor.convert(src.force_encoding('UTF-8'), safe: :unsafe, standalone: true, header_footer: true,
+                              base_dir: base_dir, attributes: ARGV).b
+    $stdout.write("ok #{out.bytesize}\n", out)
+  rescue Exception => e
+    msg = "#{e.class}: #{e.message}".b
+    $stdout.write("err #{msg.bytesize}\n", msg)
+  end
+  $stdout.flush
+end
+"""
+
+PROBE_RB = "require 'asciidoctor'; print Asciidoctor::VERSION"
+R_HEADER = re.compile(rb'(ok|err) (\d+)\n')
+
+class AsciidoctorWorker:
+    "one ruby process converting documents one at a time."
+    def __init__(self, attributes=(), encoding='UTF-8'):
+        self.encoding = encoding
+        self.proc = subprocess.Popen(['ruby', '-e', WORKER_RB, '--'] + list(attributes),
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def convert(self, src, base_dir, timeout=None):
+        """
+        src: asciidoc bytes. return (html, error). raises OSError if the worker is gone,
+        TimeoutError if it was killed after timeout seconds.
+        """
+        expired = threading.Event()
+        def kill():
+            expired.set()
+            self.proc.kill()
+        timer = threading.Timer(timeout, kill) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            self.proc.stdin.write(b'%d %s\n' % (len(src), os.fsencode(str(base_dir))))
+            self.proc.stdin.write(src)
+            self.proc.stdin.flush()
+            m = R_HEADER.fullmatch(self.proc.stdout.readline())
+            text = self.proc.stdout.read(int(m[2])).decode(self.encoding, 'replace') if m else None
+        except (BrokenPipeError, ValueError) as e:
+            m, text = None, f'asciidoctor worker failed: {e}'
+        finally:
+            if timer:
+                timer.cancel()
+        if expired.is_set():
+            raise TimeoutError(f'timed out after {timeout}s')
+        if not m:
+            raise OSError(text or 'asciidoctor worker exited')
+        return (text, '') if m[1] == b'ok' else ('', text)
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+
+class Asciidoctor:
+    """
+        pool of up to `size` workers (default: max_procs of the supervisor), started on demand.
+        concurrent converts use separate workers. the gem is probed on first use; without it every document goes through one
+        `asciidoctor` command per page, and without that `available` is False.
+    """
+    def __init__(self, size=None, attributes=(), encoding='UTF-8', supervisor=None):
+        self.size = size
+        self.attributes = list(attributes)
+        self.encoding = encoding
+        self.supervisor = supervisor or Supervisor()
+        self.lock = threading.Lock()
+        self.probed = False
+        self.version = None
+        self.persistent = False
+        self.reset()
+        atexit.register(self.close)
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.idle = queue.LifoQueue()
+        self.workers = []
+
+    def probe(self):
+        "on first use, cached per ruby and asciidoctor binaries"
+        with self.lock:
+            if self.probed:
+                return
+            self.probed = True
+            self.version, self.persistent = probe_cached('asciidoctor', ['ruby', 'asciidoctor'], self.probe_versions)
+
+    def probe_versions(self):
+        "(version, persistent): version is None without asciidoctor, persistent if the gem loads in ruby"
+        try:
+            p = subprocess.run(['ruby', '-e', PROBE_RB], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            if p.returncode == 0:
+                return f'asciidoctor {p.stdout.decode().strip()}', True
+        except OSError:
+            pass
+        if shutil.which('asciidoctor'):
+            p = subprocess.run(['asciidoctor', '--version'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            return p.stdout.decode(self.encoding, 'replace').split('\n')[0] or 'asciidoctor', False
+        return None, False
+
+    @property
+    def available(self):
+        self.probe()
+        return self.version is not None
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                if self.pid != os.getpid():
+                    # forked child: the pipes belong to the parent's workers
+                    self.reset()
+                if self.idle.empty() and len(self.workers) < (self.size or self.supervisor.max_procs):
+                    w = AsciidoctorWorker(self.attributes, self.encoding)
+                    self.workers.append(w)
+                    return w
+            w = self.idle.get()
+            if w is not None and w.proc.poll() is None:
+                return w
+            if w is not None:
+                self.discard(w)
+
+    def discard(self, worker):
+        "drop a broken worker, a thread waiting for one may start a new one"
+        with self.lock:
+            if worker in self.workers:
+                self.workers.remove(worker)
+        worker.close()
+        self.idle.put(None)
+
+    def convert(self, src, base_dir):
+        "src: asciidoc bytes. return (standalone html, error)"
+        if not self.available:
+            return '', 'asciidoctor not found'
+        if not self.persistent:
+            return self.command(src, base_dir)
+        # documents that failed are kept with the supervisor's, and counted in its summary
+        key = self.supervisor.key(['asciidoctor'], src, base_dir)
+        with self.supervisor.lock:
+            error = self.supervisor.failed.get(key)
+        if error is not None:
+            raise error
+        # a worker that died (killed, crashed on a previous document) is replaced at least once,
+        # a document that timed out is retried up to the supervisor's retries
+        for attempt in range(1 + max(1, self.supervisor.retries)):
+            worker = self.acquire()
+            try:
+                with self.supervisor.slots:
+                    with self.supervisor.lock:
+                        self.supervisor.runs += 1
+                    result = worker.convert(src, base_dir, self.supervisor.timeout)
+            except TimeoutError as e:
+                with self.supervisor.lock:
+                    self.supervisor.timeouts += 1
+                self.discard(worker)
+                result = ConverterError(['asciidoctor'], str(e))
+                continue
+            except OSError as e:
+                self.discard(worker)
+                result = '', str(e)
+                continue
+            self.idle.put(worker)
+            return result
+        if isinstance(result, ConverterError):
+            with self.supervisor.lock:
+                self.supervisor.failed[key] = result
+            raise result
+        return result
+
+    def command(self, src, base_dir):
+        p = self.supervisor.run(['asciidoctor', '-B', str(base_dir), '-o', '-', '-'] + [a for attr in self.attributes for a in ('-a', attr)], src)
+        return decode(p.stdout, self.encoding), '' if p.returncode == 0 else decode(p.stderr, self.encoding)
+
+    def close(self):
+        with self.lock:
+            workers = self.workers if self.pid == os.getpid() else []
+            self.reset()
+        for w in workers:
+            w.close()
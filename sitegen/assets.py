@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+# static asset pipeline: fingerprinted copies of static files for immutable caching
+# (css/my.css -> css/my.0123456789.css, resolved by the asset() template helper),
+# and conservative minification of rendered html and of unminified css/js.
+
+import re
+from pathlib import Path
+
+ASSET_SUFFIXES = {'.css', '.js', '.svg', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico', '.woff', '.woff2', '.ttf', '.otf', '.eot'}
+ASSET_INDEX_FILE = '.sitegen-assets.json'
+FINGERPRINT_LENGTH = 10
+
+def fingerprint_name(path, digest):
+    "css/my.css, digest -> css/my.<digest[:FINGERPRINT_LENGTH]>.css"
+    path = Path(path)
+    return path.with_name(f'{path.stem}.{digest[:FINGERPRINT_LENGTH]}{path.suffix}')
+
+def minifiable(path):
+    "css and js files which are not minified already (*.min.css, *.min.js)"
+    path = Path(path)
+    return path.suffix in ('.css', '.js') and not path.stem.endswith('.min')
+
+R_STRING = r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\''
+R_CSS_COMMENT = re.compile(rf'({R_STRING})|/\*(?!!).*?\*/', re.S)
+R_CSS_SPACE = re.compile(rf'({R_STRING})|\s+')
+CSS_PUNCT = '{};,'
+
+def minify_css(src):
+    "drop comments (except /*! ... */) and whitespace which does not separate tokens. strings are kept."
+    src = R_CSS_COMMENT.sub(lambda m: m[1] or '', src)
+    def space(m):
+        if m[1]:
+            return m[1]
+        before = src[m.start()-1] if m.start() > 0 else ''
+        after = src[m.end()] if m.end() < len(src) else ''
+        if not before or not after or before in CSS_PUNCT + ':' or after in CSS_PUNCT:
+            return ''
+        return ' '
+    return R_CSS_SPACE.sub(space, src)
+
+def minify_js(src):
+    "minified by rjsmin if installed, unchanged otherwise. javascript is not safe to minify by regexps."
+    try:
+        import rjsmin
+    except ImportError:
+        return src
+    return rjsmin.jsmin(src)
+
+R_HTML = re.compile(r'(<(pre|textarea|script|style)\b.*?</\2\s*>)|(<!--(?!\[if).*?-->)|(\s+)', re.S | re.I)
+
+def minify_html(html):
+    "collapse whitespace and drop comments, except in pre, textarea, script and style, and conditional comments"
+    def sub(m):
+        if m[1]:
+            return m[1]
+        if m[3]:
+            return ''
+        return '\n' if '\n' in m[4] else ' '
+    return R_HTML.sub(sub, html)
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+# batched markdown -> standalone html5 conversion through one `pandoc lua` process.
+# every document is read and written separately inside pandoc, so header ids, footnotes
+# and titles do not interfere between documents. json filters (pantable) run once per
+# batch on a merged document whose top-level divs are split back afterwards.
+# a batch which times out is killed without retry, its documents fall back to one-by-one
+# conversion, where a hanging document only holds up itself.
+
+import os, re, atexit, tempfile, threading
+from contextlib import suppress
+from .cache import digest, user_cache_dir
+from .supervisor import Supervisor, ConverterError, decode
+
+BATCH_SIZE = 64
+
+BATCH_LUA = r"""
+local filters = arg or {}
+local docs, errors, n = {}, {}, 0
+while true do
+  local line = io.read('l')
+  if not line then break end
+  local len = tonumber(line)
+  local src = len > 0 and io.read(len) or ''
+  n = n + 1
+  local ok, doc = pcall(pandoc.read, src, 'markdown')
+  if ok then
+    -- same as pandoc -s reading from stdin
+    if not doc.meta.title and not doc.meta.pagetitle then doc.meta.pagetitle = '-' end
+    docs[n] = doc
+  else
+    errors[n] = tostring(doc)
+  end
+end
+
+if #filters > 0 then
+  local ok, merged = pcall(function()
+    local blocks = pandoc.Blocks{}
+    for i = 1, n do
+      if docs[i] then
+        blocks:insert(pandoc.Div(docs[i].blocks, pandoc.Attr('sitegen-doc-' .. i)))
+      end
+    end
+    local m = pandoc.Pandoc(blocks)
+    for _, f in ipairs(filters) do
+      m = pandoc.utils.run_json_filter(m, f, {'html5'})
+    end
+    return m
+  end)
+  for i = 1, n do
+    if docs[i] and not ok then
+      docs[i] = nil
+      errors[i] = tostring(merged)
+    end
+  end
+  if ok then
+    for _, b in ipairs(merged.blocks) do
+      local i = b.t == 'Div' and tonumber(b.identifier:match('^sitegen%-doc%-(%d+)$'))
+      if i and docs[i] then docs[i].blocks = b.content end
+    end
+  end
+end
+
+local opts = pandoc.WriterOptions{template = pandoc.template.compile(pandoc.template.default('html5'))}
+opts.html_math_method = 'mathjax'
+for i = 1, n do
+  local ok, out = false, errors[i] or ''
+  if docs[i] then
+    ok, out = pcall(pandoc.write, docs[i], 'html5', opts)
+    out = tostring(out)
+  end
+  io.write(ok and 'ok ' or 'err ', #out, '\n', out)
+end
+"""
+
+R_HEADER = re.compile(rb'(ok|err) (\d+)\n')
+
+def remove_quietly(path):
+    with suppress(OSError):
+        os.remove(path)
+
+class BatchPandoc:
+    """
+        convert many markdown sources with one process per batch.
+        equivalent of `pandoc -s --mathjax -f markdown -t html5 [-F filter...]`.
+        version: pandoc version string, or a function returning it on first use.
+    """
+    def __init__(self, version, encoding='UTF-8', supervisor=None):
+        self.encoding = encoding
+        self.supervisor = supervisor or Supervisor()
+        self.version = version
+        self._available = None
+        self.script = None
+        self.lock = threading.Lock()
+
+    @property
+    def available(self):
+        if self._available is None:
+            self._available = self.check_version(self.version() if callable(self.version) else self.version)
+        return self._available
+
+    @available.setter
+    def available(self, value):
+        self._available = value
+
+    @staticmethod
+    def check_version(version):
+        "`pandoc lua` subcommand exists since pandoc 3.0"
+        m = re.search(r'(\d+)\.(\d+)', version or '')
+        return bool(m) and int(m[1]) >= 3
+
+    def write_script(self):
+        """
+        path of the lua driver, written once per installation to the user's cache directory.
+        a file already there is used only if its content is BATCH_LUA. without a writable
+        cache directory, the driver goes to a private temporary file of this process.
+        """
+        with self.lock:
+            if self.script is None:
+                try:
+                    self.script = self.write_cached_script()
+                except OSError:
+                    fd, path = tempfile.mkstemp(prefix='sitegen-batch-', suffix='.lua')
+                    with os.fdopen(fd, 'w', encoding='UTF-8') as f:
+                        f.write(BATCH_LUA)
+                    atexit.register(remove_quietly, path)
+                    self.script = path
+            return self.script
+
+    @staticmethod
+    def write_cached_script():
+        path = os.path.join(user_cache_dir(), f'batch-{digest(BATCH_LUA)[:16]}.lua')
+        with suppress(OSError), open(path, encoding='UTF-8') as f:
+            if f.read() == BATCH_LUA:
+                return path
+        tmp = f'{path}.{os.getpid()}'
+        with open(tmp, 'w', encoding='UTF-8') as f:
+            f.write(BATCH_LUA)
+        os.replace(tmp, path)
+        return path
+
+    def convert_many(self, sources, filters=[]):
+        """
+        sources: list of markdown bytes.
+        return list of (html, error). html is None if the document was not converted,
+        so that the caller can fall back to one-by-one conversion.
+        """
+        if not sources:
+            return []
+        if not self.available:
+            return [(None, 'batch conversion not available')] * len(sources)
+        script = self.write_script()
+        src = b''.join(b'%d\n%s' % (len(s), s) for s in sources)
+        try:
+            p = self.supervisor.run(['pandoc', 'lua', script] + list(filters), src, retries=0)
+        except ConverterError as e:
+            return [(None, str(e))] * len(sources)
+        results = self.parse(p.stdout)
+        if len(results) != len(sources):
+            if p.returncode != 0 and not p.stdout:
+                self.available = False
+            error = decode(p.stderr, self.encoding)
+            return [(None, error)] * len(sources)
+        return results
+
+    def parse(self, out):
+        results = []
+        pos = 0
+        while pos < len(out):
+            m = R_HEADER.match(out, pos)
+            if not m:
+                break
+            start = m.end()
+            end = start + int(m[2])
+            text = out[start:end].decode(self.encoding, 'replace')
+            results.append((text, '') if m[1] == b'ok' else (None, text))
+            pos = end
+        return results
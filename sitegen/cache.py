@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+# content-addressed on-disk cache for converter outputs
+
+import os, hashlib, threading
+from pathlib import Path
+
+CACHE_DIR = '.sitegen-cache'
+CACHE_ENCODING = 'UTF-8'
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+def digest(*parts):
+    "sha256 hex digest of parts. str parts are utf-8 encoded, parts are separated by NUL."
+    h = hashlib.sha256()
+    for p in parts:
+        if isinstance(p, str):
+            p = p.encode(CACHE_ENCODING)
+        h.update(p)
+        h.update(b'\0')
+    return h.hexdigest()
+
+def user_cache_dir():
+    """
+    per-user directory for files kept between builds, $XDG_CACHE_HOME/sitegen or ~/.cache/sitegen,
+    created private to the user. raises OSError
+    """
+    d = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'sitegen')
+    os.makedirs(d, mode=0o700, exist_ok=True)
+    return d
+
+def file_digest(path, bufsize=1024*1024):
+    "sha256 hex digest of file content."
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(bufsize), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+class ConversionCache:
+    """
+        key -> text store under cachedir.
+        cachedir/ab/abcdef0123... (key = sha256 hex)
+        entries are touched on hit, evict() removes least recently used entries
+        until total size fits in max_size.
+    """
+    def __init__(self, cachedir=CACHE_DIR, max_size=DEFAULT_MAX_SIZE):
+        self.cachedir = Path(cachedir)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def path(self, key):
+        return self.cachedir / key[:2] / key
+
+    def get(self, key):
+        p = self.path(key)
+        try:
+            data = p.read_bytes()
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(p)
+        except OSError:
+            pass
+        with self.lock:
+            self.hits += 1
+        return data.decode(CACHE_ENCODING)
+
+    def has(self, key):
+        return self.path(key).is_file()
+
+    def put(self, key, data):
+        p = self.path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_name(f'{key}.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp.write_bytes(data.encode(CACHE_ENCODING))
+        os.replace(tmp, p)
+
+    def entries(self):
+        if not self.cachedir.is_dir():
+            return
+        for sub in os.scandir(self.cachedir):
+            # other users of cachedir (template bytecode) keep to longer names
+            if not sub.is_dir() or len(sub.name) != 2:
+                continue
+            for e in os.scandir(sub.path):
+                if e.is_file() and not e.name.endswith('.tmp'):
+                    yield e
+
+    def evict(self):
+        "remove least recently used entries over max_size. return number of removed entries."
+        if self.max_size is None:
+            return 0
+        entries = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in self.entries()]
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+class MemoryCache:
+    "ConversionCache compatible in-memory store, used when the on-disk cache is disabled."
+    def __init__(self):
+        self.store = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            data = self.store.get(key)
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return data
+
+    def has(self, key):
+        return key in self.store
+
+    def put(self, key, data):
+        with self.lock:
+            self.store[key] = data
+
+    def evict(self):
+        with self.lock:
+            removed = len(self.store)
+            self.store.clear()
+        return removed
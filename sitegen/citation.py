@@ -1,19 +1,108 @@
-from citeproc.source.bibtex import BibTeX
-from citeproc import CitationStylesStyle, CitationStylesBibliography, formatter
+# -*- coding: utf-8 -*-
+
+# citations of pages with `bibliography:` (and optional `csl:`) metadata, by citeproc-py.
+# pandoc leaves citations as <span class="citation" data-cites="key ...">, which are replaced
+# with formatted citations, and the references go into <div id="refs"> or after the body.
+#
+# bib and csl files are parsed once by the site-wide Bibliographies and shared between pages
+# and threads. each page registers its citations in its own CitationStylesBibliography.
+
+import re, threading
+from pathlib import Path
+
+DEFAULT_STYLES = ['harvard1', 'harvard-cite-them-right']
+CSL_DIR = Path.home() / '.csl'
+R_CITATION = re.compile(r'<span\s+class="citation"\s+data-cites="([^"]*)">.*?</span>', re.S)
+R_REFS = re.compile(r'<div\s+id="refs"[^>]*>\s*</div>')
+
+def resolve_csl(name, basedir):
+    "csl file next to the page or in ~/.csl, otherwise name of a style bundled with citeproc-py"
+    if not name:
+        return None
+    for d in [Path(basedir), CSL_DIR]:
+        if (d / name).is_file():
+            return (d / name).resolve()
+    return name
+
+def load_style(csl):
+    from citeproc import CitationStylesStyle
+    for name in ([csl] if csl else DEFAULT_STYLES):
+        try:
+            return CitationStylesStyle(str(name), validate=False)
+        except (ValueError, OSError):
+            continue
+    raise ValueError(f'csl style not found: {csl or DEFAULT_STYLES[0]}')
+
 class Bibliography:
-    def __init__(self, bib_file, csl_file):
+    "parsed bib and csl files"
+    def __init__(self, bib_file, csl=None):
+        from citeproc.source.bibtex import BibTeX
         self.bib_file = bib_file
-        self.csl_file = csl_file
-        self.bibtex = BibTeX(bib_file)
-        self.style = CitationStylesStyle(csl_file, validate=False)
-        self.bibliography = CitationStylesBibliography(bib_style, bib_source,formatter.plain)
-
-    def citation(self, pandocname):
-        c = Citation([CitationItem('whole-collection')])
-        self.bibliography.register(c)
-        return self.bibliography.cite(c)
-    
-    def bibliography(self):
-        for item in self.bibliography.bibliography():
-            str(item)
-        
+        self.csl = csl
+        self.source = BibTeX(str(bib_file))
+        self.style = load_style(csl)
+        # citeproc keeps the formatter of the current bibliography on the style
+        self.lock = threading.Lock()
+
+    def render(self, html, warn=None):
+        "html with citations formatted and the list of references added"
+        from citeproc import CitationStylesBibliography, Citation, CitationItem, formatter
+        spans = list(R_CITATION.finditer(html))
+        if not spans:
+            return html
+        missing = set()
+        def unknown(item):
+            missing.add(item.key)
+
+        with self.lock:
+            bibliography = CitationStylesBibliography(self.style, self.source, formatter.html)
+            citations = []
+            for m in spans:
+                c = Citation([CitationItem(key) for key in m[1].split()])
+                bibliography.register(c)
+                citations.append(c)
+            cited = [str(bibliography.cite(c, unknown)) for c in citations]
+            refs = ''.join(f'<div class="csl-entry">{item}</div>\n' for item in bibliography.bibliography())
+        if missing and warn:
+            warn(f'citations not found in {self.bib_file}: {", ".join(sorted(missing))}')
+
+        parts, pos = [], 0
+        for m, c in zip(spans, cited):
+            parts += [html[pos:m.start()], f'<span class="citation" data-cites="{m[1]}">{c}</span>']
+            pos = m.end()
+        parts.append(html[pos:])
+        html = ''.join(parts)
+
+        refs = f'<div id="refs" class="references csl-bib-body" role="list">\n{refs}</div>'
+        html, n = R_REFS.subn(lambda m: refs, html, count=1)
+        if not n:
+            i = html.rfind('</body>')
+            html = html[:i] + refs + html[i:] if i >= 0 else html + refs
+        return html
+
+class Bibliographies:
+    """
+        (bib, csl) -> Bibliography of the whole site. a pair is parsed once, by the first
+        thread asking for it, and again only after stamp(file) changed.
+    """
+    def __init__(self, stamp):
+        self.stamp = stamp
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, bib_file, csl=None):
+        key = (str(bib_file), str(csl))
+        stamp = [self.stamp(bib_file), self.stamp(csl) if isinstance(csl, Path) else None]
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry['stamp'] != stamp:
+                entry = self.entries[key] = {'stamp': stamp, 'lock': threading.Lock(), 'value': None, 'error': None}
+        with entry['lock']:
+            if entry['value'] is None and entry['error'] is None:
+                try:
+                    entry['value'] = Bibliography(bib_file, csl)
+                except Exception as e:
+                    entry['error'] = e
+        if entry['error'] is not None:
+            raise entry['error']
+        return entry['value']
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+# precompressed siblings of text outputs for nginx gzip_static/brotli_static:
+# foo.html -> foo.html.gz, foo.html.br. brotli needs the optional `brotli` package.
+
+import os, gzip
+from pathlib import Path
+
+COMPRESS_FORMATS = ['gz', 'br']
+COMPRESS_SUFFIXES = {'.html', '.css', '.js', '.json', '.svg', '.xml'}
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+def compressible(path):
+    return Path(path).suffix in COMPRESS_SUFFIXES
+
+def siblings(path, formats):
+    "compressed sibling paths of path"
+    return [path.with_name(f'{path.name}.{fmt}') for fmt in formats]
+
+def parse_formats(s):
+    "'gz,br' -> ['gz', 'br']. raises ValueError for unknown formats or missing brotli"
+    formats = [f for f in (s or '').split(',') if f]
+    for fmt in formats:
+        if fmt not in COMPRESS_FORMATS:
+            raise ValueError(f'unknown compression format: {fmt}')
+        if fmt == 'br':
+            try:
+                import brotli
+            except ImportError:
+                raise ValueError('brotli compression needs the brotli package')
+    return formats
+
+def compress_data(data, fmt):
+    if fmt == 'gz':
+        # mtime=0: same input, same bytes
+        return gzip.compress(data, GZIP_LEVEL, mtime=0)
+    import brotli
+    return brotli.compress(data, quality=BROTLI_QUALITY)
+
+def compress_file(path, formats):
+    "write compressed siblings of path, with the mtime of path. return the written paths"
+    path = Path(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    st = os.stat(path)
+    written = []
+    for fmt, dst in zip(formats, siblings(path, formats)):
+        tmp = dst.with_name(f'.{dst.name}.{os.getpid()}.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(compress_data(data, fmt))
+        os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(tmp, dst)
+        written.append(dst)
+    return written
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+# site-wide link graph: the links of every converted page, resolved to destination paths
+# relative to the site root. links only change with the source of a page, so the graph is
+# kept in dstdir/LINKS_FILE and a page is scanned again only when its source stamp changed.
+#
+# LINKS_FILE = {dstpath: {'stamp': source stamp, 'links': [dstpath, ...]}}
+#
+# from the graph: links not made to siblings (not_linked), pages linking to a page
+# (backlinks), and a report of broken links and pages no other page links to.
+
+import os, re, json, posixpath, threading
+from collections import defaultdict
+from html import unescape
+from urllib.parse import urlsplit, unquote
+
+LINKS_FILE = '.sitegen-links.json'
+R_HREF = re.compile(r'<a\s[^>]*?\bhref\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.I)
+
+def extract_links(html):
+    "href of <a> elements in html"
+    return [unescape(m[1] if m[1] is not None else m[2] if m[2] is not None else m[3]) for m in R_HREF.finditer(html)]
+
+def resolve(dstpath, href):
+    """
+    href in the page at dstpath -> destination path relative to the site root,
+    None for external urls and links within the page. 'dir/' means 'dir/index.html'.
+    """
+    url = urlsplit(href)
+    if url.scheme or url.netloc or not url.path:
+        return None
+    path = unquote(url.path)
+    if path.startswith('/'):
+        path = path.lstrip('/')
+    else:
+        path = posixpath.join(posixpath.dirname(dstpath), path)
+    index = not path or path.endswith('/') or posixpath.basename(path) in ('.', '..')
+    path = posixpath.normpath(path or '.')
+    return posixpath.normpath(posixpath.join(path, 'index.html')) if index else path
+
+class LinkGraph:
+    def __init__(self, path):
+        self.path = path
+        self.pages = {}
+        self.lock = threading.Lock()
+        self.incoming = None
+        self.dirty = False
+        try:
+            with open(path) as f:
+                self.pages = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def links(self, dstpath, stamp=None):
+        "resolved links of the page, None if it was not scanned since stamp changed"
+        record = self.pages.get(dstpath)
+        if record is None or (stamp is not None and record['stamp'] != stamp):
+            return None
+        return record['links']
+
+    def set(self, dstpath, stamp, hrefs):
+        "record the links of a page, return the pages it started or stopped linking to"
+        links = sorted({p for p in (resolve(dstpath, href) for href in hrefs) if p and p != dstpath})
+        with self.lock:
+            old = self.pages.get(dstpath, {}).get('links', [])
+            self.pages[dstpath] = {'stamp': stamp, 'links': links}
+            self.incoming = None
+            self.dirty = True
+        return set(old) ^ set(links)
+
+    def prune(self, dstpaths):
+        "drop pages which no longer exist, return the pages they linked to"
+        keep = set(dstpaths)
+        with self.lock:
+            removed = [v['links'] for k, v in self.pages.items() if k not in keep]
+            if removed:
+                self.pages = {k: v for k, v in self.pages.items() if k in keep}
+                self.incoming = None
+                self.dirty = True
+        return {target for links in removed for target in links}
+
+    def update(self, other, dstpaths):
+        "take the records of dstpaths from the graph other, return the pages they started or stopped linking to"
+        changed = set()
+        with self.lock:
+            for dstpath in dstpaths:
+                record = other.pages.get(dstpath)
+                if record is not None and record != self.pages.get(dstpath):
+                    changed |= set(self.pages.get(dstpath, {}).get('links', [])) ^ set(record['links'])
+                    self.pages[dstpath] = record
+                    self.incoming = None
+                    self.dirty = True
+        return changed
+
+    def backlinks(self, dstpath):
+        "sorted pages linking to dstpath"
+        with self.lock:
+            if self.incoming is None:
+                incoming = defaultdict(list)
+                for source in sorted(self.pages):
+                    for target in self.pages[source]['links']:
+                        incoming[target].append(source)
+                self.incoming = incoming
+            return self.incoming.get(dstpath, [])
+
+    def report(self, outputs):
+        """
+        {'broken': [[page, target], ...], 'orphans': [page, ...]}
+        outputs: every destination path of the site, link targets which are not in it are broken.
+        orphans are pages no other page links to, except index pages, which are linked
+        by the navigation of the pages below them.
+        """
+        outputs = set(outputs)
+        broken = [[source, target] for source in sorted(self.pages) for target in self.pages[source]['links'] if target not in outputs]
+        orphans = [page for page in sorted(self.pages) if posixpath.basename(page) != 'index.html' and not self.backlinks(page)]
+        return {'broken': broken, 'orphans': orphans}
+
+    def save(self):
+        "write the graph if it changed since it was loaded or saved"
+        with self.lock:
+            if not self.dirty:
+                return
+            pages = dict(self.pages)
+            self.dirty = False
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(pages, f, sort_keys=True)
+        os.replace(tmp, self.path)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+# build manifest: per-page dependency records of the last build
+
+import os, stat, json, threading
+from .cache import file_digest
+
+MANIFEST_FILE = '.sitegen-manifest.json'
+HASH_INDEX_FILE = '.sitegen-hashes.json'
+MANIFEST_VERSION = 1
+
+def stamp(path):
+    "cheap change stamp of a file. None if the file does not exist."
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+class Manifest:
+    """
+        dstpath -> dependency record of the page, as written by the last build.
+        record = {'source': stamp, 'templates': {filename: stamp}, 'config': digest, 'siblings': digest, ...}
+        durations = dstpath -> seconds the page took to generate, used for scheduling.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.pages = {}
+        self.durations = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.pages = data.get('pages', {})
+                self.durations = data.get('durations', {})
+        except (OSError, ValueError):
+            pass
+
+    def get(self, dstpath):
+        return self.pages.get(str(dstpath))
+
+    def set(self, dstpath, record):
+        with self.lock:
+            self.pages[str(dstpath)] = record
+            self.dirty = True
+
+    def duration(self, dstpath):
+        return self.durations.get(str(dstpath))
+
+    def set_duration(self, dstpath, seconds):
+        with self.lock:
+            self.durations[str(dstpath)] = round(seconds, 6)
+            self.dirty = True
+
+    def prune(self, dstpaths):
+        "drop records of pages which no longer exist"
+        keep = {str(p) for p in dstpaths}
+        with self.lock:
+            if any(k not in keep for k in self.pages) or any(k not in keep for k in self.durations):
+                self.pages = {k: v for k, v in self.pages.items() if k in keep}
+                self.durations = {k: v for k, v in self.durations.items() if k in keep}
+                self.dirty = True
+
+    def save(self):
+        "write the manifest if it changed since it was loaded or saved"
+        if not self.dirty:
+            return
+        self.dirty = False
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'pages': self.pages, 'durations': self.durations}, f, sort_keys=True)
+        os.replace(tmp, self.path)
+
+class StatCache:
+    """
+        stat results shared through a build, so that each file is stat'ed once.
+        filled by the directory walk, invalidated when a file is written.
+        missing files are cached as None.
+    """
+    def __init__(self):
+        self.stats = {}
+
+    def put(self, path, st):
+        self.stats[str(path)] = st
+
+    def stat(self, path):
+        key = str(path)
+        try:
+            return self.stats[key]
+        except KeyError:
+            pass
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        self.stats[key] = st
+        return st
+
+    def stamp(self, path):
+        st = self.stat(path)
+        return None if st is None else [st.st_mtime_ns, st.st_size]
+
+    def invalidate(self, path):
+        self.stats.pop(str(path), None)
+
+    def clear(self):
+        self.stats = {}
+
+class MtimeStamper:
+    "change detection by mtime and size. outputs are only checked for existence."
+    def __init__(self, stats=None):
+        self.stats = stats or StatCache()
+
+    def stamp(self, path):
+        return self.stats.stamp(path)
+
+    def output(self, path):
+        st = self.stats.stat(path)
+        return st is not None and stat.S_ISREG(st.st_mode)
+
+    def save(self):
+        pass
+
+class HashStamper:
+    """
+        change detection by content digest, for checkouts and restored caches where
+        mtimes are meaningless. digests are kept in a sidecar index with the stat data
+        they were computed from, so a file is only hashed again when its stat changes.
+        index = {path: {'stat': [mtime_ns, size], 'digest': sha256}}
+    """
+    def __init__(self, path, stats=None):
+        self.path = path
+        self.stats = stats or StatCache()
+        self.index = {}
+        self.seen = set()
+        self.lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def stamp(self, path):
+        key = str(path)
+        st = self.stats.stamp(path)
+        if st is None:
+            return None
+        with self.lock:
+            self.seen.add(key)
+            entry = self.index.get(key)
+        if entry and entry['stat'] == st:
+            return entry['digest']
+        d = file_digest(path)
+        with self.lock:
+            self.index[key] = {'stat': st, 'digest': d}
+        return d
+
+    def output(self, path):
+        return self.stamp(path)
+
+    def save(self):
+        with self.lock:
+            index = {k: v for k, v in self.index.items() if k in self.seen}
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(index, f, sort_keys=True)
+        os.replace(tmp, self.path)
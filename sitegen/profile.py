@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+# per-page phase timing for `sitegen --profile trace.json`.
+# spans are written as a chrome trace (chrome://tracing, https://ui.perfetto.dev) and
+# summarized per phase and per page. span() is a no-op unless a profiler is started.
+
+import os, json, time, threading
+from contextlib import contextmanager, nullcontext
+from collections import defaultdict
+
+PROFILE_TOP = 20
+NULL_SPAN = nullcontext()
+
+_profiler = None
+
+class Profiler:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, page=None, args=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            e = {'name': name, 'cat': 'page' if page else 'build', 'ph': 'X',
+                 'ts': round((start - self.origin) * 1e6, 1), 'dur': round((end - start) * 1e6, 1),
+                 'pid': os.getpid(), 'tid': threading.get_native_id()}
+            if page or args:
+                e['args'] = dict(args or {}, **({'page': page} if page else {}))
+            with self.lock:
+                self.events.append(e)
+
+    def drain(self):
+        "take recorded events, used by worker processes to send them back"
+        with self.lock:
+            events, self.events = self.events, []
+        return events
+
+    def extend(self, events):
+        with self.lock:
+            self.events.extend(events)
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+    def summary(self, workers, top=PROFILE_TOP):
+        "lines of phase totals, slowest pages and worker utilisation"
+        phases = defaultdict(float)
+        pages = defaultdict(lambda: defaultdict(float))
+        for e in self.events:
+            page = e.get('args', {}).get('page')
+            if page:
+                pages[page][e['name']] += e['dur'] / 1e6
+                if e['name'] != 'page':
+                    phases[e['name']] += e['dur'] / 1e6
+        lines = ['phase totals (s):']
+        for name, t in sorted(phases.items(), key=lambda x: -x[1]):
+            lines.append(f'  {name:24} {t:10.3f}')
+        lines.append(f'slowest {top} pages (s):')
+        for page, p in sorted(pages.items(), key=lambda x: -x[1]['page'])[:top]:
+            detail = ', '.join(f'{k} {v:.3f}' for k, v in sorted(p.items(), key=lambda x: -x[1]) if k != 'page')
+            lines.append(f'  {p["page"]:8.3f} {page}  ({detail})')
+        render = [e for e in self.events if e['name'] == 'render-stage']
+        if render:
+            wall = sum(e['dur'] for e in render) / 1e6
+            busy = sum(p['page'] for p in pages.values())
+            if wall > 0:
+                lines.append(f'render stage: {wall:.3f}s wall, {busy:.3f}s in pages, utilisation {busy/(wall*workers):.0%} of {workers} workers')
+        return lines
+
+def after_fork():
+    "a forked worker starts without the events of its parent, which has them already"
+    if _profiler is not None:
+        _profiler.events = []
+        _profiler.lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=after_fork)
+
+def start():
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+def stop():
+    global _profiler
+    p, _profiler = _profiler, None
+    return p
+
+def active():
+    return _profiler
+
+def span(name, page=None, **args):
+    "time the with-block as phase `name` of `page`"
+    if _profiler is None:
+        return NULL_SPAN
+    return _profiler.span(name, page, args)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# publishing static files into the output directory.
+#
+# copy      shutil.copy
+# hardlink  os.link, output shares the inode with the source
+# reflink   copy-on-write clone (FICLONE) or os.copy_file_range, data is not copied
+#           through user space and shares extents on btrfs/xfs
+# symlink   absolute symbolic link to the source
+#
+# every mode falls back to copy when it is not possible (other device, no support).
+# files whose size and content already match are left untouched.
+
+import os, shutil
+from .cache import file_digest
+
+PUBLISH_MODES = ['copy', 'hardlink', 'reflink', 'symlink']
+FICLONE = 0x40049409
+
+def identical(src, dst, mode='copy'):
+    "dst is already what publishing src by mode would make"
+    if mode == 'symlink':
+        return os.path.islink(dst) and os.readlink(dst) == os.path.abspath(src)
+    try:
+        s, d = os.stat(src), os.lstat(dst)
+    except OSError:
+        return False
+    shared = (s.st_dev, s.st_ino) == (d.st_dev, d.st_ino)
+    if mode == 'hardlink':
+        return shared
+    if shared or os.path.islink(dst):
+        return False
+    return s.st_size == d.st_size and file_digest(src) == file_digest(dst)
+
+def clone(fs, fd):
+    "copy-on-write clone of file objects, then in-kernel copy"
+    try:
+        import fcntl
+        fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+        return
+    except (ImportError, OSError):
+        pass
+    if not hasattr(os, 'copy_file_range'):
+        raise OSError('copy_file_range not available')
+    size = os.fstat(fs.fileno()).st_size
+    copied = 0
+    while copied < size:
+        n = os.copy_file_range(fs.fileno(), fd.fileno(), size - copied)
+        if n == 0:
+            break
+        copied += n
+
+def reflink(src, dst):
+    with open(src, 'rb') as fs, open(dst, 'wb') as fd:
+        clone(fs, fd)
+    shutil.copymode(src, dst)
+
+def publish(src, dst, mode='copy'):
+    """
+    put src at dst by mode, return the mode actually used or None if dst was already identical.
+    dst is replaced atomically.
+    """
+    if identical(src, dst, mode):
+        return None
+    tmp = os.path.join(os.path.dirname(dst), f'.{os.path.basename(dst)}.{os.getpid()}.tmp')
+    for m in ([mode, 'copy'] if mode != 'copy' else ['copy']):
+        try:
+            if m == 'hardlink':
+                os.link(src, tmp)
+            elif m == 'symlink':
+                os.symlink(os.path.abspath(src), tmp)
+            elif m == 'reflink':
+                reflink(src, tmp)
+            else:
+                shutil.copy(src, tmp)
+            os.replace(tmp, dst)
+            return m
+        except OSError:
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+            if m == 'copy':
+                raise
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+# sharded trigram index for the search page (--search-index=ngram).
+#
+# text is lowercased and cut into trigrams of utf-16 code units, the same units javascript
+# strings are indexed by, so CJK text works without a tokenizer. postings keep positions,
+# so the search page can check that the trigrams of a query are adjacent instead of just
+# present. trigrams are spread over shard files by fnv-1a hash, and the search page only
+# loads the shards of the trigrams in the query.
+#
+# SEARCH_DIR/docs.js       sitegen_search.docs({"shards": n, "docs": [[url, title, snippet], ...]})
+# SEARCH_DIR/<shard>.js    sitegen_search.shard(i, {trigram: [[docid, pos, ...], ...], ...})
+
+import os, json, threading
+from collections import defaultdict
+
+SEARCH_DIR = 'searchindex'
+SEARCH_ENTRIES_FILE = '.sitegen-search.json'
+SNIPPET_LENGTH = 200
+SHARD_POSTINGS = 20000
+MAX_SHARDS = 4096
+
+def fnv1a(units):
+    "32bit fnv-1a of utf-16-le encoded bytes, hashed per code unit"
+    h = 2166136261
+    for i in range(0, len(units), 2):
+        h ^= units[i] | (units[i+1] << 8)
+        h = (h * 16777619) & 0xffffffff
+    return h
+
+def trigrams(text):
+    "{utf-16-le bytes of trigram: [positions]}"
+    b = text.lower().encode('utf-16-le', 'surrogatepass')
+    grams = defaultdict(list)
+    for i in range(len(b)//2 - 2):
+        grams[b[2*i:2*i+6]].append(i)
+    return grams
+
+class NgramIndex:
+    def __init__(self):
+        self.docs = []
+        self.postings = defaultdict(list)
+        self.count = 0
+
+    def add(self, url, title, content):
+        docid = len(self.docs)
+        self.docs.append([url, title, content[:SNIPPET_LENGTH]])
+        for gram, positions in trigrams(content).items():
+            self.postings[gram].append([docid] + positions)
+            self.count += len(positions) + 1
+
+    def nshards(self):
+        n = 1
+        while n < MAX_SHARDS and n * SHARD_POSTINGS < self.count:
+            n *= 2
+        return n
+
+    def write(self, dstdir):
+        "write docs.js and shards into dstdir/SEARCH_DIR, remove shards of earlier builds"
+        outdir = os.path.join(dstdir, SEARCH_DIR)
+        os.makedirs(outdir, exist_ok=True)
+        n = self.nshards()
+        shards = [{} for i in range(n)]
+        for gram, plist in self.postings.items():
+            shards[fnv1a(gram) & (n-1)][gram.decode('utf-16-le', 'surrogatepass')] = plist
+
+        written = {'docs.js'}
+        with open(os.path.join(outdir, 'docs.js'), 'w') as f:
+            f.write(f'sitegen_search.docs({json.dumps({"shards": n, "docs": self.docs})})')
+        for i, shard in enumerate(shards):
+            name = f'{i:x}.js'
+            with open(os.path.join(outdir, name), 'w') as f:
+                f.write(f'sitegen_search.shard({i},{json.dumps(shard, separators=(",", ":"))})')
+            written.add(name)
+        for name in os.listdir(outdir):
+            if name not in written:
+                os.remove(os.path.join(outdir, name))
+
+class SearchEntries:
+    """
+        search entries of pages kept between builds, so that only changed pages are
+        read again. {dstpath: {'stamp': source stamp, 'entry': {'url', 'title', 'content'}}}
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.seen = set()
+        self.lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, key, stamp, extract):
+        "entry of key if stamp is unchanged, otherwise extract() it again"
+        key = str(key)
+        with self.lock:
+            self.seen.add(key)
+            e = self.entries.get(key)
+        if e is not None and e['stamp'] == stamp:
+            return e['entry']
+        entry = extract()
+        with self.lock:
+            self.entries[key] = {'stamp': stamp, 'entry': entry}
+        return entry
+
+    def save(self):
+        with self.lock:
+            entries = {k: v for k, v in self.entries.items() if k in self.seen}
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp, self.path)
+
+def write_searchindex(f, entries):
+    "stream entries into searchindex.js, same output as f'var data={json.dumps(list(entries))}'"
+    f.write('var data=[')
+    for i, entry in enumerate(entries):
+        if i:
+            f.write(', ')
+        f.write(json.dumps(entry))
+    f.write(']')
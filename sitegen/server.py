@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# local http server for `sitegen --serve`.
+# html pages get a small script injected on the fly which listens on an event stream
+# and reloads the page after each rebuild. files in the output directory are untouched.
+
+import os, threading, functools
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+RELOAD_PATH = '/__sitegen/reload'
+RELOAD_SCRIPT = f'<script>new EventSource("{RELOAD_PATH}").onmessage=function(){{location.reload()}};</script>'.encode()
+KEEPALIVE = 15
+
+class ReloadHandler(SimpleHTTPRequestHandler):
+    server_version = 'sitegen'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == RELOAD_PATH:
+            return self.event_stream()
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            if not self.path.split('?', 1)[0].endswith('/'):
+                # let SimpleHTTPRequestHandler redirect to the trailing slash
+                return super().do_GET()
+            path = os.path.join(path, 'index.html')
+        if not path.endswith('.html') or not os.path.isfile(path):
+            return super().do_GET()
+        with open(path, 'rb') as f:
+            body = f.read()
+        i = body.rfind(b'</body>')
+        body = body[:i] + RELOAD_SCRIPT + body[i:] if i >= 0 else body + RELOAD_SCRIPT
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def event_stream(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        reload = self.server.reload
+        generation = reload.generation
+        try:
+            while True:
+                with reload.cond:
+                    reload.cond.wait_for(lambda: reload.generation != generation, timeout=KEEPALIVE)
+                    changed = reload.generation != generation
+                    generation = reload.generation
+                self.wfile.write(b'data: reload\n\n' if changed else b': ping\n\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+class Reload:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.generation = 0
+
+    def notify(self):
+        with self.cond:
+            self.generation += 1
+            self.cond.notify_all()
+
+class DevServer:
+    def __init__(self, dstdir, port=8000, host='127.0.0.1'):
+        handler = functools.partial(ReloadHandler, directory=str(dstdir))
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.reload = Reload()
+        self.url = f'http://{host}:{self.httpd.server_address[1]}/'
+
+    def start(self):
+        t = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        t.start()
+        return t
+
+    def reload(self):
+        self.httpd.reload.notify()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# sharded builds across machines.
+#
+#   sitegen src -o _shard1 -i --shard 1/4     (one per machine, 1/4 ... 4/4)
+#   sitegen merge _shard1 _shard2 _shard3 _shard4 -o _output
+#
+# pages are assigned to shards by a hash of their dstpath, the same on every machine.
+# every shard scans the whole site, so siblings, index pages and asset() urls agree,
+# but only generates its own pages. the shard directory gets SHARD_FILE:
+#
+# {'version': 1, 'shard': [k, n], 'search_format': 'full' | 'ngram', 'compress': [formats],
+#  'outputs': [path, ...], 'search': [[position, entry], ...] or null without -i}
+#
+# position is the index of the page in the whole site, so that the merged search index
+# lists pages in the same order as an unsharded build.
+
+import os, json, hashlib
+from pathlib import Path
+
+SHARD_FILE = '.sitegen-shard.json'
+SHARD_VERSION = 1
+
+def parse_shard(s):
+    "'2/4' -> (2, 4). raises ValueError"
+    try:
+        k, n = (int(x) for x in s.split('/'))
+    except ValueError:
+        raise ValueError(f'shard must be K/N: {s}')
+    if not 1 <= k <= n:
+        raise ValueError(f'shard out of range: {s}')
+    return k, n
+
+def shard_of(dstpath, n):
+    "shard (1..n) of dstpath. sha256, not hash(), which differs between processes"
+    h = hashlib.sha256(Path(dstpath).as_posix().encode('utf-8')).digest()
+    return int.from_bytes(h[:8], 'big') % n + 1
+
+def write_shard_file(dstdir, shard, search_format, compress, outputs, search):
+    data = {'version': SHARD_VERSION, 'shard': list(shard), 'search_format': search_format,
+            'compress': list(compress), 'outputs': sorted(Path(p).as_posix() for p in outputs), 'search': search}
+    path = Path(dstdir) / SHARD_FILE
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def read_shards(shard_dirs):
+    """
+    shard files of shard_dirs, checked to be one complete set of the same build.
+    return [(shard_dir, data)] ordered by shard. raises ValueError
+    """
+    shards = []
+    for d in shard_dirs:
+        try:
+            with open(Path(d) / SHARD_FILE) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ValueError(f'not a shard output: {d}: {e}')
+        if data.get('version') != SHARD_VERSION:
+            raise ValueError(f'unknown shard file version: {d}')
+        shards.append((Path(d), data))
+    if not shards:
+        raise ValueError('no shards')
+    n = shards[0][1]['shard'][1]
+    for key in ['search_format', 'compress']:
+        if len({json.dumps(data[key]) for d, data in shards}) > 1:
+            raise ValueError(f'shards were built with different {key}')
+    if any(data['shard'][1] != n for d, data in shards):
+        raise ValueError('shards of different builds: shard counts differ')
+    found = sorted(data['shard'][0] for d, data in shards)
+    if found != list(range(1, n+1)):
+        missing = sorted(set(range(1, n+1)) - set(found))
+        raise ValueError(f'incomplete shards of {n}: ' + (f'missing {missing}' if missing else f'duplicated in {found}'))
+    return sorted(shards, key=lambda s: s[1]['shard'][0])
+
+def search_entries(shards):
+    "merged search entries in site order, None if the shards were built without -i"
+    if all(data['search'] is None for d, data in shards):
+        return None
+    entries = sorted(((position, entry) for d, data in shards for position, entry in data['search'] or []), key=lambda e: e[0])
+    return [entry for position, entry in entries]
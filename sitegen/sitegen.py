@@ -5,23 +5,41 @@
 # based on http://obraz.pirx.ru/
 # install requirements: pandoc
 
-import sys, os, io, re, traceback, errno, subprocess
-import shutil, fnmatch, yaml, concurrent.futures
-from contextlib import contextmanager
-from jinja2 import Environment, FileSystemLoader, ChoiceLoader, PackageLoader
-from jinja2.exceptions import TemplateSyntaxError
+import sys, os, io, re, json, posixpath, errno, threading, time
+import shutil, fnmatch, tempfile, itertools, concurrent.futures
+from contextlib import contextmanager, suppress
+from collections import defaultdict
 from pathlib import Path
-from pyquery import PyQuery
-from urllib.parse import urlparse, urljoin
-import tqdm
+from html import escape
+from .cache import ConversionCache, MemoryCache, CACHE_DIR, DEFAULT_MAX_SIZE, digest, file_digest
+from .batch import BatchPandoc, BATCH_SIZE
+from .asciidoc import Asciidoctor
+from .supervisor import Supervisor, ConverterError, decode, probe_cached, DEFAULT_TIMEOUT, DEFAULT_RETRIES
+from .citation import Bibliographies, resolve_csl
+from .search import NgramIndex, SearchEntries, write_searchindex, SEARCH_DIR, SEARCH_ENTRIES_FILE
+from .publish import publish, PUBLISH_MODES
+from .compress import compressible, siblings, compress_file, parse_formats
+from .links import LinkGraph, extract_links, LINKS_FILE
+from .shard import parse_shard, shard_of, write_shard_file, read_shards, search_entries
+from .assets import ASSET_SUFFIXES, ASSET_INDEX_FILE, fingerprint_name, minifiable, minify_css, minify_js, minify_html
+from . import profile
+from .profile import span
+from .manifest import Manifest, StatCache, MtimeStamper, HashStamper, MANIFEST_FILE, HASH_INDEX_FILE
 DEBUG = False
 PAGE_ENCODING = 'UTF-8'
 DEFAULT_TEMPLATE = 'default.j2.html'
 MARKDOWN_TEMPLATE = 'markdown.j2.html'
 INDEX_TEMPLATE = 'index.j2.html'
 CONFIG_YAML = 'config.yaml'
+DIR_CONFIG_YAML = '_config.yaml'
+TEMPLATE_CACHE_DIR = 'templates'
+PACKAGE_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
 DOCX_TEMPLATE = 'reference.docx'
 PANTABLE = shutil.which('pantable')
+IGNORE_LIST = ['.', '.*','_', '*~', '#*#']
+R_IGNORE = re.compile('|'.join(fnmatch.translate(p) for p in IGNORE_LIST))
+STREAM_WINDOW = 1024 # pages converted and rendered at a time by --stream
+INFLIGHT_PER_JOB = 4 # pages submitted to the render workers ahead of the results
 
 def makedirs(directory):
     if os.path.exists(directory):
@@ -42,6 +60,10 @@ def log(message):
     sys.stderr.write(f'{message}\n')
     sys.stderr.flush()
 
+def progress_bar(total):
+    import tqdm
+    return tqdm.tqdm(total=total, unit='file')
+
 @contextmanager
 def report_exceptions():
     try:
@@ -49,7 +71,7 @@ def report_exceptions():
     except KeyboardInterrupt:
         raise KeyboardInterrupt()
     except Exception:
-        import sys
+        import traceback
         e, m, tb = sys.exc_info()
         print('exception traceback:'.ljust(80, '='))
         for tbi in traceback.format_tb(tb):
@@ -61,24 +83,54 @@ def report_exceptions():
             pdb.post_mortem(tb)
 
 def command_str(args, src=None, cwd=None):
+    """
+    run args through the supervisor, return (stdout, error). error is stderr if the command failed.
+    raises ConverterError if it timed out or was killed on every try.
+    """
     if src and isinstance(src,str):
         src = src.encode(PAGE_ENCODING)
-    out,err = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, cwd=cwd).communicate(input=src)
-    return '' if not out else out.decode(PAGE_ENCODING), '' if not err else err.decode(PAGE_ENCODING)
+    p = supervisor.run(args, src, cwd)
+    return decode(p.stdout, PAGE_ENCODING), decode(p.stderr, PAGE_ENCODING) if p.returncode else ''
 
 class ConfigYaml:
     def __init__(self, path, yaml_src):
-        self.metadata = {}
-        self.path = path
-        if yaml_src:
+        self.path = Path(path)
+        self.yaml_src = yaml_src
+        self.digest = digest(yaml_src or '')
+
+    @property
+    def metadata(self):
+        "parsed on first use. up-to-date checks only need the digest"
+        try:
+            return self._metadata
+        except AttributeError:
+            pass
+        self._metadata = {}
+        if self.yaml_src:
+            import yaml
             try:
-                self.metadata = yaml.load(yaml_src)
-            except:
-                log(f'error loading yaml: {path}')
+                data = yaml.safe_load(self.yaml_src)
+            except Exception:
+                log(f'error loading yaml: {self.path}')
+            else:
+                if isinstance(data, dict):
+                    self._metadata = data
+                elif data is not None:
+                    log(f'yaml is not a mapping: {self.path}')
+        return self._metadata
+
+    @property
+    def cascade_digest(self):
+        "digest of this config and the configs it falls back to"
+        return self.digest
 
     def get(self, name):
         return self.metadata.get(name)
 
+    def basedir(self, name):
+        "directory relative paths in metadata[name] are relative to, None if name is not set"
+        return self.path.parent if name in self.metadata else None
+
     def get_fullpath(self, name):
         """ get fullpath of metadata[name] as relative path from self.path """
         a = self.metadata.get(name)
@@ -91,61 +143,172 @@ class ConfigYaml:
         return cls(path, open(path).read())
         
 class LocalConfigYaml(ConfigYaml):
+    """
+        config of a source directory (DIR_CONFIG_YAML) or of a page (yaml block) on top of
+        its parent: the config of the parent directory, up to the site config.
+        merged values, digests and full paths are resolved once per instance, and the configs of
+        directories are memoized by Site.dir_config, so a _config.yaml is read and merged once.
+    """
     def __init__(self, path, yaml_src, parent):
         super().__init__(path, yaml_src)
         self.parent = parent
+        self.fullpaths = {}
+
+    @property
+    def merged(self):
+        "metadata of the directory configs from the site root down, overridden by this one. without the site config"
+        try:
+            return self._merged
+        except AttributeError:
+            pass
+        parent = self.parent.merged if isinstance(self.parent, LocalConfigYaml) else {}
+        self._merged = {**parent, **self.metadata}
+        return self._merged
+
+    @property
+    def cascade_digest(self):
+        try:
+            return self._cascade_digest
+        except AttributeError:
+            pass
+        self._cascade_digest = digest(self.parent.cascade_digest, self.digest)
+        return self._cascade_digest
 
     def get(self, name):
-        return self.get(name) or self.parent.get(name)
+        if name in self.metadata:
+            return self.metadata[name]
+        return self.parent.get(name)
+
+    def basedir(self, name):
+        return super().basedir(name) or self.parent.basedir(name)
 
     def get_fullpath(self, name):
-        return self.get_fullpath(name) or self.parent.get_fullpath(name)
+        if name not in self.fullpaths:
+            self.fullpaths[name] = super().get_fullpath(name) if name in self.metadata else self.parent.get_fullpath(name)
+        return self.fullpaths[name]
 
 
 class TemplateEngine:
-    def __init__(self, templatedir=None):
-        self.defaultloader = PackageLoader("sitegen", "templates")
-
+    """
+        compiled templates are kept in memory for the whole run (no stat per render, reset()
+        drops them) and in the bytecode cache under cachedir between runs.
+        jinja2 is loaded on first render or parse, up-to-date checks only resolve filenames.
+    """
+    def __init__(self, templatedir=None, cachedir=None):
         self.templatedir = templatedir
         if self.templatedir:
-            self.template_files = list(p for p in Path(templatedir).glob('**/*') if p.is_file())
-            if not self.template_files:
+            if not any(p.is_file() for p in Path(templatedir).glob('**/*')):
                 self.templatedir = None
-                
-        if self.templatedir:
-            loader = ChoiceLoader([
-                FileSystemLoader(self.templatedir),
-                self.defaultloader])
-        else:
-            loader = self.defaultloader
+        self.searchpath = ([os.fspath(self.templatedir)] if self.templatedir else []) + [PACKAGE_TEMPLATE_DIR]
 
-        self.env = Environment(loader=loader)
+        self.bytecode_dir = None
+        if cachedir:
+            self.bytecode_dir = Path(cachedir) / TEMPLATE_CACHE_DIR
+            makedirs(self.bytecode_dir)
+        self._env = None
+        self.reset()
+
+    @property
+    def env(self):
+        if self._env is None:
+            from jinja2 import Environment, FileSystemLoader, ChoiceLoader, PackageLoader, FileSystemBytecodeCache
+            loader = PackageLoader("sitegen", "templates")
+            if self.templatedir:
+                loader = ChoiceLoader([FileSystemLoader(self.templatedir), loader])
+            bytecode_cache = FileSystemBytecodeCache(str(self.bytecode_dir)) if self.bytecode_dir else None
+            self._env = Environment(loader=loader, bytecode_cache=bytecode_cache, auto_reload=False)
+        return self._env
+
+    def reset(self):
+        "forget compiled templates and template dependencies, called when template files changed."
+        self.deps = {}
+        self.vars = {}
+        self.refs = {}
+        self.filenames = {}
+        if self._env is not None and self._env.cache is not None:
+            self._env.cache.clear()
 
     def render(self, template, metadata):
+        from jinja2.exceptions import TemplateSyntaxError
         try:
             t = self.env.get_template(template)
             return t.render(**metadata)
         except TemplateSyntaxError as e:
             raise Exception(f"{e.filename}:{e.lineno}: {e.name}, {e.message}")
 
-    @property
-    def lastmodified(self):
-        "return if one of the template is updated."
-        lm = Path(__file__).stat().st_mtime
-        if not self.templatedir:
-            return lm
-        tmp = max(p.stat().st_mtime for p in self.template_files)
-        return max(lm, tmp)
-        #return max(lm, max(p.stat().st_mtime for p in walk_files(self.templatedir)))
+    def dependencies(self, template):
+        "names of the template and of all templates it extends, includes or imports."
+        from jinja2 import meta
+        if template not in self.deps:
+            source, filename, uptodate = self.env.loader.get_source(self.env, template)
+            self.filenames[template] = filename
+            deps = {template}
+            for ref in meta.find_referenced_templates(self.env.parse(source)):
+                if ref:
+                    deps |= self.dependencies(ref)
+            self.deps[template] = deps
+        return self.deps[template]
+
+    def variables(self, templates):
+        "names of the variables referenced by templates"
+        from jinja2 import meta
+        names = set()
+        for t in templates:
+            if t not in self.vars:
+                source = self.env.loader.get_source(self.env, t)[0]
+                self.vars[t] = meta.find_undeclared_variables(self.env.parse(source))
+            names |= self.vars[t]
+        return names
+
+    def references(self, templates, name):
+        "if templates reference the variable name. only templates with name in their source are parsed, missing ones are skipped."
+        key = (name, *templates)
+        if key not in self.refs:
+            def mentions(t):
+                filename = self.filename(t)
+                if filename is None:
+                    return False
+                with open(filename, encoding=PAGE_ENCODING) as f:
+                    return name in f.read()
+            mentioned = [t for t in templates if mentions(t)]
+            self.refs[key] = bool(mentioned) and name in self.variables(mentioned)
+        return self.refs[key]
+
+    def filename(self, template):
+        "filename the template name resolves to, None if not found. the same as the jinja2 loaders give."
+        if template not in self.filenames:
+            pieces = [p for p in template.split('/') if p and p != '.']
+            paths = (os.path.normpath(posixpath.join(d, *pieces)) for d in self.searchpath)
+            self.filenames[template] = next((p for p in paths if os.path.isfile(p)), None)
+        return self.filenames[template]
 
     
 class Pandoc:
     # based on https://github.com/bebraw/pypandoc/blob/master/pypandoc/pypandoc.py
-    def __init__(self):
-        self.src_fmts = command_str(['pandoc', '--list-input-formats'])[0].splitlines()
-        self.dst_fmts = command_str(['pandoc', '--list-output-formats'])[0].splitlines()
+    # src_fmts, dst_fmts and version are probed on first use, and cached per pandoc binary
+    def __getattr__(self, name):
+        if name not in ('src_fmts', 'dst_fmts', 'version'):
+            raise AttributeError(name)
+        try:
+            self.src_fmts, self.dst_fmts, self.version = probe_cached('pandoc', ['pandoc'], self.probe)
+        except ConverterError as e:
+            log(f'pandoc probe failed: {e}')
+            self.src_fmts, self.dst_fmts, self.version = [], [], None
+        return getattr(self, name)
+
+    @staticmethod
+    def probe():
+        try:
+            return (command_str(['pandoc', '--list-input-formats'])[0].splitlines(),
+                    command_str(['pandoc', '--list-output-formats'])[0].splitlines(),
+                    command_str(['pandoc', '--version'])[0].split('\n')[0])
+        except OSError:
+            # not installed. sitegen still loads, markdown pages fail in check_format
+            return [], [], None
 
     def check_format(self, src_format, dst_format):
+        if self.version is None:
+            raise RuntimeError('pandoc not found')
         if src_format not in self.src_fmts:
             raise RuntimeError('Invalid src format! Expected one of these: ' + ', '.join(self.src_fmts))
         if dst_format not in self.dst_fmts:
@@ -156,13 +319,33 @@ class Pandoc:
         data,error = command_str(['pandoc', '--from='+src_format, '--to='+dst_format] + extra_args, src)
         return data,error
 
+    def cache_key(self, src, src_format, dst_format, extra_args=[]):
+        "key of conversion result. filters (files in extra_args) are stamped with their mtime."
+        stamps = [str(os.stat(a).st_mtime) for a in extra_args if os.path.isfile(a)]
+        return digest(src, self.version, src_format, dst_format, *extra_args, *stamps)
+
+    def convert_cached(self, cache, src, src_format, dst_format, extra_args=[], cwd=None):
+        if cache is None:
+            return self.convert(src, src_format, dst_format, extra_args, cwd)
+        key = self.cache_key(src, src_format, dst_format, extra_args)
+        data = cache.get(key)
+        if data is not None:
+            return data, ''
+        data,error = self.convert(src, src_format, dst_format, extra_args, cwd)
+        if data.strip() and not error:
+            cache.put(key, data)
+        return data,error
+
     def convert_write(self, src, src_format, dst_filename, dst_format, extra_args=[], cwd=None):
         self.check_format(src_format,dst_format)
         data,error = command_str(['pandoc', '--from='+src_format, '--to='+dst_format, '-o',dst_filename] + extra_args, src)
         return data, error
 
     
+supervisor = Supervisor()
 pandoc = Pandoc()
+batch_pandoc = BatchPandoc(lambda: pandoc.version, PAGE_ENCODING, supervisor)
+asciidoctor = Asciidoctor(encoding=PAGE_ENCODING, supervisor=supervisor)
 
 def asciidoc_convert(src, extra_args=[], cwd=None):
     # args = ['asciidoc', '-a' 'mathjax', '-s', '-o', '-', '-']
@@ -176,16 +359,35 @@ class PageBase:
         dstpath = srcpath or srcpath.with_suffix(something)
         srcfile = basepath + srcpath
         dstfile = dst_basedir + dstpath
+        pages live through the whole build, so they only keep site and the two paths,
+        everything else is derived on use.
     """
+    __slots__ = ('site', 'srcpath', 'dstpath')
+
     def __init__(self, site, srcpath):
         self.site = site
-        self.src_basedir = site.srcdir
         self.srcpath = Path(srcpath)
         self.dstpath = self.srcpath
-        self.srcfile = self.src_basedir / self.srcpath # fullpath
-        self.url = str(self.dstpath)
-        self.depth = len(self.dstpath.parts)-1
-        self.root = '/'.join(['..'] * (self.depth)) if self.depth>0 else '.'
+
+    @property
+    def src_basedir(self):
+        return self.site.srcdir
+
+    @property
+    def srcfile(self):
+        return self.site.srcdir / self.srcpath # fullpath
+
+    @property
+    def url(self):
+        return str(self.dstpath)
+
+    @property
+    def depth(self):
+        return len(self.dstpath.parts)-1
+
+    @property
+    def root(self):
+        return '/'.join(['..'] * (self.depth)) if self.depth>0 else '.'
 
     def generate(self, dstbasedir):
         raise NotImplemented()
@@ -193,21 +395,24 @@ class PageBase:
     def __repr__(self):
         return f"PageBase({self.srcfile})"
 
-    def need_update(self, lastmodified, dstdir):
-        """
-        return if dstination file (at basedirectory dstdir) needs update or not
-        """
-        d = dstdir / self.dstpath
-        if not d.is_file():
-            return True
-        else:
-            if d.stat().st_mtime < lastmodified:
-                return True
-        return False
+    def outputs(self):
+        "paths this page writes, relative to the destination directory"
+        return [self.dstpath]
 
     @property
     def lastmodified(self):
-        return self.srcfile.stat().st_mtime
+        return self.site.stats.stat(self.srcfile).st_mtime
+
+    def dependencies(self, templates=(), inputs=()):
+        """
+        dependency record of this page, compared with the manifest of the last build.
+        templates: template names loaded by the last render.
+        inputs: other files read by the last render (bibliography).
+        """
+        d = {'source': self.site.stamper.stamp(self.srcfile)}
+        if inputs:
+            d['inputs'] = {f: self.site.stamper.stamp(f) for f in inputs}
+        return d
 
     @property
     def search_json(self):
@@ -221,20 +426,67 @@ class PageBase:
         return df
 
 class PageFile(PageBase):
+    __slots__ = ('fingerprint',)
+
     def __init__(self, site, srcpath):
         super().__init__(site, srcpath)
+        self.fingerprint = None # dstpath with content digest, set by Site.fingerprint_assets
+
+    def outputs(self):
+        return [self.dstpath] + ([self.fingerprint] if self.fingerprint else [])
+
+    @property
+    def minify(self):
+        return self.site.minify and minifiable(self.srcpath)
 
     def generate(self, dstbasedir):
-        df = self.make_dstdir(dstbasedir)
-        shutil.copy(self.srcfile, df)
+        with span('publish', self.url):
+            df = self.make_dstdir(dstbasedir)
+            if self.minify:
+                self.write_minified(df)
+            else:
+                publish(self.srcfile, df, self.site.publish_mode)
+            if self.fingerprint:
+                publish(df, dstbasedir/self.fingerprint, 'hardlink')
+
+    def write_minified(self, df):
+        source = open(self.srcfile, encoding=PAGE_ENCODING).read()
+        key = digest('minify', self.srcpath.suffix, source)
+        data = self.site.cache.get(key)
+        if data is None:
+            data = minify_css(source) if self.srcpath.suffix == '.css' else minify_js(source)
+            self.site.cache.put(key, data)
+        tmp = df.with_name(f'.{df.name}.{os.getpid()}.tmp')
+        with open(tmp, 'w', encoding=PAGE_ENCODING) as f:
+            f.write(data)
+        os.replace(tmp, df)
+
+    def dependencies(self, templates=(), inputs=()):
+        d = super().dependencies(templates, inputs)
+        d['publish'] = self.site.publish_mode
+        if self.fingerprint:
+            d['fingerprint'] = str(self.fingerprint)
+        if self.minify:
+            d['minify'] = True
+        return d
 
 class PageTemplated(PageBase):
+    __slots__ = ('default_template', 'templates', 'inputs')
+
     def __init__(self, site, srcpath, default_template):
         super().__init__(site, srcpath)
         self.dstpath = srcpath.with_suffix('.html')
-        self.url = str(self.dstpath)
         self.default_template = default_template
+        self.templates = ()
+        self.inputs = []
 
+    @property
+    def config(self):
+        "ConfigYaml the page is rendered with"
+        return self.site.config
+
+    @property
+    def parts(self):
         """
         parts = [(link, name)]
 
@@ -279,7 +531,7 @@ class PageTemplated(PageBase):
         names = ['Home'] + pp
         if names[-1]=='index':
             names.pop()
-        self.parts = [(rel_parent(dd-i), name) for i,name in enumerate(names)]
+        return [(rel_parent(dd-i), name) for i,name in enumerate(names)]
 
     def render_template(self, metadata={}):
         metadata['url'] = self.url
@@ -288,89 +540,218 @@ class PageTemplated(PageBase):
         metadata['parts'] = self.parts
         metadata['mtime'] = self.lastmodified
         metadata['sitename'] = self.site.config.get('sitename')
+        metadata['search_index'] = self.site.search_format
         metadata['site'] = self.site
         metadata['page'] = self
+        metadata['asset'] = self.asset
 
         template = metadata.get('template') or self.default_template
-        return self.site.template_engine.render(template, metadata)
+        self.templates = sorted(self.site.template_engine.dependencies(template))
+        with span('render', self.url):
+            return self.site.template_engine.render(template, metadata)
+
+    def add_input(self, path):
+        if path not in self.inputs:
+            self.inputs.append(path)
+
+    def asset(self, path):
+        "template helper: url of static file `path` (relative to the site root), fingerprinted if enabled"
+        a = self.site.assets.get(path)
+        if a is None:
+            return f'{self.root}/{path}'
+        fingerprint, srcfile = a
+        self.add_input(srcfile)
+        return f'{self.root}/{fingerprint.as_posix()}'
+
+    def write(self, dstbasedir, html):
+        if self.site.minify:
+            with span('minify', self.url):
+                html = minify_html(html)
+        with span('write', self.url):
+            dstfile = self.make_dstdir(dstbasedir)
+            with open(dstfile, 'wb') as f:
+                f.write(html.encode(PAGE_ENCODING))
+
+    def dependencies(self, templates=(), inputs=()):
+        d = super().dependencies(templates, inputs)
+        stamp = self.site.stamper.stamp
+        d['sitegen'] = self.site.shared('sitegen', lambda: stamp(__file__))
+        engine = self.site.template_engine
+        def template_stamps():
+            # a template deleted since the last build has no file and no stamp, the page is stale
+            filenames = {t: engine.filename(t) for t in templates}
+            return {t: [f, f and stamp(f)] for t, f in filenames.items()}
+        d['templates'] = self.site.shared(('templates', *templates), template_stamps)
+        d['config'] = self.config.cascade_digest
+        d['search_index'] = self.site.search_format
+        if self.site.fingerprint:
+            d['fingerprint'] = True
+        if self.site.minify:
+            d['minify'] = True
+        d['siblings'] = digest(*sorted(self.site.get_siblings(self.dstpath)))
+        if engine.references(templates, 'backlinks'):
+            d['backlinks'] = digest(*self.site.backlinks(self.dstpath))
+        return d
 
 class MarkdownHtml:
+    """
+        title, toc, body and links of pandoc's standalone html in one pass of lxml's pull parser.
+        elements are dropped once read, and body is the source between <body> and </body>.
+    """
+    R_BODY = re.compile(r'<body[^>]*>(.*)</body>', re.I|re.S)
+
     def __init__(self, src):
-        # dirty 
-        self.q = PyQuery(src.replace('xmlns="http://www.w3.org/1999/xhtml"',' '))
-        self.title = self.q('title').text() or self.q('h1').text() or self.q('h2').text() or ''
-        self.toc = self.get_toc()
-        self.body = self.q('body').html()
-
-    def get_toc(self):
-        def get_last_child(e, level):
-            if level==0:
-                return e
-            if level>0:
-                ee = e.children('ul:last-child')
-                if not ee:
-                    #e.append('<li>no title</li>')
-                    e.append('<ul></ul>')
-                    ee = e.children('ul:last-child')
-                return get_last_child(ee, level-1)
-    
-        out = PyQuery('<ul></ul>')
-        for tag in self.q('h1, h2, h3').items():
-            level = int(tag[0].tag[1])-1
-            assert(0<=level)
-            aname = tag.attr('id')
-            pp = get_last_child(out, level)
-            pp.append(f'<li><a href="#{aname}">{tag.text()}</a></li>\n')
-        return out.html() or ""
+        from lxml import etree
+        titles = {'title': [], 'h1': [], 'h2': []}
+        headings = []
+        self.links = []
+
+        parser = etree.HTMLPullParser(events=('start', 'end'))
+        parser.feed(src)
+        parser.close()
+        for event, el in parser.read_events():
+            tag = el.tag
+            if event == 'start':
+                if tag == 'a':
+                    self.links.append(el.get('href'))
+                continue
+            if tag in ('h1', 'h2', 'h3', 'title'):
+                text = ' '.join(''.join(el.itertext()).split())
+                if tag in titles:
+                    titles[tag].append(text)
+                if tag != 'title':
+                    headings.append((int(tag[1])-1, el.get('id'), text))
+            parent = el.getparent()
+            if parent is not None and parent.tag in ('head', 'body'):
+                el.clear()
+                while el.getprevious() is not None:
+                    del parent[0]
+
+        self.title = ' '.join(titles['title']) or ' '.join(titles['h1']) or ' '.join(titles['h2']) or ''
+        self.toc = self.make_toc(headings)
+        m = self.R_BODY.search(src)
+        self.body = m[1] if m else src
+
+    @staticmethod
+    def make_toc(headings):
+        "headings [(level, id, text)] -> nested <ul> items. each level opens a <ul> after the last <li>"
+        root = []
+        for level, aname, text in headings:
+            node = root
+            for i in range(level):
+                if not node or not isinstance(node[-1], list):
+                    node.append([])
+                node = node[-1]
+            a = f'<a href="#{escape(str(aname))}">{escape(text, quote=False)}</a>' if text else f'<a href="#{escape(str(aname))}"/>'
+            node.append(f'<li>{a}</li>\n')
+        def html(node):
+            return ''.join(x if isinstance(x, str) else f'<ul>{html(x)}</ul>' for x in node)
+        return html(root)
 
     def get_links(self):
-        ll = []
-        for tag in self.q('a').items():
-            ll.append(tag.attr('href'))
-        return ll
+        return self.links
 
     
 class PageMarkdown(PageTemplated):
+    __slots__ = ()
+    batch = True # converted by batch_pandoc in Site.prefetch
+
     def __init__(self, site, srcpath):
         super().__init__(site, srcpath, MARKDOWN_TEMPLATE)
 
+    @staticmethod
+    def pandoc_filters():
+        return [str(PANTABLE)] if PANTABLE else []
+
+    @staticmethod
+    def pandoc_args():
+        pantable = [a for f in PageMarkdown.pandoc_filters() for a in ('-F', f)]
+        return ['-s', '--mathjax'] + pantable
+
+    def read_source(self):
+        "return (yaml_src, markdown source)"
+        with span('read', self.url):
+            s = open(self.srcfile, 'r').read()
+        with span('split_metadata_block', self.url):
+            return PageMarkdown.split_metadata_block(s)
+
+    @property
+    def config(self):
+        return self.site.dir_config(self.srcpath.parent)
+
+    def local_config(self, yaml_src):
+        "config of the yaml block of the page on top of the directory configs"
+        return LocalConfigYaml(self.srcfile, yaml_src, self.config)
+
+    def cache_key(self, source):
+        return pandoc.cache_key(source.encode(PAGE_ENCODING), 'markdown', 'html5', self.pandoc_args())
+
+    def convert(self, source):
+        "markdown source -> (standalone html, error)"
+        with span('pandoc', self.url):
+            return pandoc.convert_cached(self.site.cache, source.encode(PAGE_ENCODING), 'markdown', 'html5', self.pandoc_args(), cwd=self.srcfile.parent)
+
     @property
     def search_json(self):
-        source = open(self.srcfile, 'r').read()
-        yaml_src, source = PageMarkdown.split_metadata_block(source)
+        yaml_src, source = self.read_source()
         source = re.sub(r'\s+',' ',source)
         return {'url': self.url,
                 'title': self.srcpath.stem,
                 'content': self.srcpath.stem+' '+source}
 
     def generate(self, dstbasedir):
-        s = open(self.srcfile, 'r').read()
-        yaml_src, source = PageMarkdown.split_metadata_block(s)
-        y = LocalConfigYaml(self.srcpath, yaml_src, self.site.config)
-        # bib = Bibliography(y.get_fullpath('bibliography'), y.get_fullpath('csl'))
+        self.inputs = []
+        yaml_src, source = self.read_source()
+        y = self.local_config(yaml_src)
 
-        pantable = ['-F', str(PANTABLE)] if PANTABLE else []
-        extra_args=['-s', '--mathjax'] + pantable
+        s,err = self.convert(source)
 
-        s,err = pandoc.convert(source.encode(PAGE_ENCODING), 'markdown', 'html5', extra_args, cwd=self.srcfile.parent)
-        
         if not s.strip() or err:
             s = f'<html><head><title>ERROR {self.srcpath}</title></head><body><pre>{err}</pre><div>{s}</div></body></html>'
+        else:
+            s = self.cite(y, s)
 
-        parse = MarkdownHtml(s)
+        with span('parse', self.url):
+            parse = MarkdownHtml(s)
         # body = body.replace('[TOC]', toc)
 
-        metadata = y.metadata
+        metadata = y.merged
         metadata['title'] = parse.title
         metadata['toc'] = parse.toc
         metadata['body'] = parse.body
         metadata['source'] = source
-        metadata['siblings'] = self.site.get_siblings(self.dstpath)
-        metadata['not_linked'] = self.site.get_siblings_not_linked(self.dstpath, parse.get_links())
+        with span('siblings', self.url):
+            metadata['siblings'] = sorted(self.site.get_siblings(self.dstpath))
+            metadata['not_linked'] = self.site.get_siblings_not_linked(self.dstpath)
+            metadata['backlinks'] = self.site.backlinks(self.dstpath)
 
-        dstfile = self.make_dstdir(dstbasedir)
-        with open(dstfile, 'wb') as f:
-            f.write(self.render_template(metadata).encode(PAGE_ENCODING))
+        self.write(dstbasedir, self.render_template(metadata))
+
+    def bibliography(self, config):
+        """
+        site-wide Bibliography of `bibliography:` and `csl:` of the page config, None without bibliography.
+        paths are relative to the yaml block or _config.yaml setting them.
+        """
+        if not config.get('bibliography'):
+            return None
+        bib = config.get_fullpath('bibliography')
+        csl = resolve_csl(config.get('csl'), config.basedir('csl') or self.srcfile.parent)
+        for p in (bib, csl):
+            if isinstance(p, Path):
+                self.add_input(str(p))
+        return self.site.bibliographies.get(bib, csl)
+
+    def cite(self, config, html):
+        "format citations in converted html"
+        try:
+            bib = self.bibliography(config)
+        except Exception as e:
+            log(f'WARNING: {self.srcpath}: bibliography: {e}')
+            return html
+        if bib is None:
+            return html
+        with span('citeproc', self.url):
+            return bib.render(html, lambda message: log(f'WARNING: {self.srcpath}: {message}'))
 
     def generate_docx(self, dstbasedir):
         s = open(self.srcfile, 'r').read()
@@ -395,146 +776,801 @@ class PageMarkdown(PageTemplated):
         else:
             return '', source
 
+class PageAsciidoc(PageMarkdown):
+    "asciidoc page. converted by asciidoctor workers, then rendered like a markdown page."
+    __slots__ = ()
+    batch = False
+
+    def read_source(self):
+        "return ('', asciidoc source). asciidoc has its own document attributes instead of a yaml block"
+        with span('read', self.url):
+            return '', open(self.srcfile, 'r').read()
+
+    R_INCLUDE = re.compile(r'^include::([^\[\n]*)\[', re.M)
+
+    def includes(self, source):
+        """
+        absolute paths of the files included by source and by the included files.
+        None if a target is not a plain path (attribute references, urls), which only asciidoctor can resolve.
+        """
+        found = []
+        todo = [(source, self.srcfile.parent.resolve())]
+        while todo:
+            text, basedir = todo.pop()
+            for target in self.R_INCLUDE.findall(text):
+                if '{' in target or '://' in target:
+                    return None
+                path = (basedir / target).resolve()
+                if path not in found:
+                    found.append(path)
+                    with suppress(OSError):
+                        todo.append((path.read_text(encoding=PAGE_ENCODING, errors='replace'), path.parent))
+        return found
+
+    def cache_key(self, source, includes=None):
+        "None if the document includes files which can not be followed, it is not cached then"
+        includes = self.includes(source) if includes is None else includes
+        if includes is None:
+            return None
+        # includes and the other relative paths are resolved against the directory of the page
+        contents = [f'{p}:{file_digest(p) if p.is_file() else ""}' for p in includes]
+        return digest(source, str(self.srcfile.parent.resolve()), asciidoctor.version, *asciidoctor.attributes, *contents)
+
+    def convert(self, source):
+        "asciidoc source -> (standalone html, error)"
+        with span('asciidoctor', self.url):
+            includes = self.includes(source)
+            for p in includes or ():
+                self.add_input(str(p))
+            key = None if includes is None else self.cache_key(source, includes)
+            data = key and self.site.cache.get(key)
+            if data is not None:
+                return data, ''
+            data, error = asciidoctor.convert(source.encode(PAGE_ENCODING), self.srcfile.parent.resolve())
+            if key and data.strip() and not error:
+                self.site.cache.put(key, data)
+            return data, error
+
 class PageIndex(PageTemplated):
+    __slots__ = ()
+
     def __init__(self, site, srcpath):
         super().__init__(site, srcpath, INDEX_TEMPLATE)
 
     def generate(self, dstbasedir):
+        self.inputs = []
         metadata = {}
         metadata['title'] = f"Index of {self.dstpath.parent}"
         metadata['toc'] = ''
         metadata['body'] = ''
         metadata['source'] = ''
-        metadata['siblings'] = self.site.get_siblings(self.dstpath)
+        with span('siblings', self.url):
+            metadata['siblings'] = sorted(self.site.get_siblings(self.dstpath))
+            metadata['backlinks'] = self.site.backlinks(self.dstpath)
 
-        dstfile = self.make_dstdir(dstbasedir)
-        with open(dstfile, 'wb') as f:
-            f.write(self.render_template(metadata).encode(PAGE_ENCODING))
+        self.write(dstbasedir, self.render_template(metadata))
 
     @property
     def lastmodified(self):
         return 0
             
 class Site:
-    def __init__(self, srcdir, templatedir=None):
+    def __init__(self, srcdir, templatedir=None, cachedir=CACHE_DIR, cache_size=DEFAULT_MAX_SIZE, batch_size=BATCH_SIZE, hash_mode=False, jobs=None, search_format='full', publish_mode='copy', compress=(), fingerprint=False, minify=False, stream=False, shard=None, link_report=None, links_from=None):
         self.srcdir = Path(srcdir)
-        self.template_engine = TemplateEngine(templatedir)
-        self.pages = []
+        self.shard = shard
+        self.link_report = link_report
+        self.links_from = links_from
+        self.links = None
+        self.stream = stream
+        self.memo = {}
+        self.fingerprint = fingerprint
+        self.minify = minify
+        self.assets = {}
+        self.compress_formats = list(compress)
+        self.publish_mode = publish_mode
+        self.search_format = search_format
+        self.jobs = jobs or os.cpu_count() or 1
+        self.fork_workers = True # render in forked processes where worth it, see render()
+        self.hash_mode = hash_mode
+        self.stats = StatCache()
+        self.stamper = MtimeStamper(self.stats)
+        self.template_engine = TemplateEngine(templatedir, cachedir)
+        if cachedir:
+            self.cache = ConversionCache(cachedir, cache_size)
+        elif stream:
+            # conversions of the link scan wait on disk until their window is rendered, not in memory.
+            # every entry is evicted at the end of a build
+            self.spill = tempfile.TemporaryDirectory(prefix='sitegen-stream-')
+            self.cache = ConversionCache(self.spill.name, 0)
+        else:
+            self.cache = MemoryCache()
+        self.bibliographies = Bibliographies(lambda path: self.stamper.stamp(path))
+        self.batch_size = batch_size
+        self.manifest = None
         self.config = ConfigYaml.from_file(CONFIG_YAML)
+        self.load()
 
-        dstpaths = []
-        for srcpath in self.walk_site(srcdir):
-            suffix = srcpath.suffix
-
-            with report_exceptions():
-                if suffix in ['.md', '.markdown']:
-                    page = PageMarkdown(self, srcpath)
-                else:
-                    page = PageFile(self, srcpath)
+    def load(self):
+        "walk srcdir and make pages"
+        self.pages = []
+        self.memo = {}
+        self.dir_configs = {}
+        self.config_dirs = set()
+        self.stats.clear()
+        dstpaths = set()
+        dirs = []
+        asciidoc = 0
+        with span('scan'):
+            for srcpath, is_dir in self.walk(self.srcdir):
+                if is_dir:
+                    dirs.append(srcpath)
+                    continue
+                if srcpath.name == DIR_CONFIG_YAML:
+                    self.config_dirs.add(srcpath.parent)
+                    continue
+                suffix = srcpath.suffix
 
-                if page.dstpath in dstpaths:
-                    log(f'WARNING: destination file overlapped: dst={page.dstpath}, src={page.srcpath}')
-                dstpaths.append(page.dstpath)
+                with report_exceptions():
+                    if suffix in ['.md', '.markdown']:
+                        page = PageMarkdown(self, srcpath)
+                    elif suffix in ['.adoc', '.asciidoc'] and asciidoctor.available:
+                        page = PageAsciidoc(self, srcpath)
+                    else:
+                        asciidoc += suffix in ['.adoc', '.asciidoc']
+                        page = PageFile(self, srcpath)
+
+                    if page.dstpath in dstpaths:
+                        log(f'WARNING: destination file overlapped: dst={page.dstpath}, src={page.srcpath}')
+                    dstpaths.add(page.dstpath)
 
-                self.pages.append(page)
+                    self.pages.append(page)
+        if asciidoc:
+            log(f'WARNING: asciidoctor not found, {asciidoc} asciidoc files are copied as they are')
 
-        for srcpath in self.walk_site(srcdir,get_dir=True):
+        for srcpath in dirs:
             with report_exceptions():
                 index = srcpath / Path('index.html')
                 if not index in dstpaths:
                     page = PageIndex(self, index)
                     self.pages.append(page)
 
+        self.make_index()
         log(f'Loaded {len(self.pages)} files')
 
-    def is_ignored(self, filepath, ignore_list=['.', '.*','_', '*~', '#*#']):
-        for ignore in ignore_list:
-            if any(fnmatch.fnmatch(part, ignore) for part in filepath.parts):
-                return True
-        return False
+    def make_index(self):
+        "destination directory -> pages in it and index pages of its subdirectories"
+        self.dirs = defaultdict(list)
+        self.siblings = {}
+        for page in self.pages:
+            parent = page.dstpath.parent
+            self.dirs[parent].append(page)
+            if page.dstpath.name == 'index.html' and parent != parent.parent:
+                self.dirs[parent.parent].append(page)
+
+    def dir_config(self, reldir):
+        """
+        config of srcdir/reldir: its DIR_CONFIG_YAML on top of the config of the parent directory,
+        up to the site config. directories without one share their parent's.
+        memoized until load() or invalidate_config()
+        """
+        config = self.dir_configs.get(reldir)
+        if config is None:
+            parent = self.config if reldir == reldir.parent else self.dir_config(reldir.parent)
+            config = parent
+            if reldir in self.config_dirs:
+                path = self.srcdir / reldir / DIR_CONFIG_YAML
+                with report_exceptions():
+                    config = LocalConfigYaml(path, path.read_text(), parent)
+            config = self.dir_configs.setdefault(reldir, config)
+        return config
+
+    def invalidate_config(self, reldir):
+        "forget the configs of reldir and the directories below it, after its DIR_CONFIG_YAML changed"
+        if (self.srcdir / reldir / DIR_CONFIG_YAML).is_file():
+            self.config_dirs.add(reldir)
+        else:
+            self.config_dirs.discard(reldir)
+        self.dir_configs = {d: c for d, c in self.dir_configs.items() if d != reldir and reldir not in d.parents}
 
-    def walk_site(self, basedir, get_dir=False):
-        for p in Path(basedir).glob('**/*'):
-            if self.is_ignored(p):
-                continue
-            if (p.is_file() and not get_dir) or (p.is_dir() and get_dir):
-                yield p.relative_to(basedir)
-        
-    def get_siblings(self, dstpath):
-        def is_siblings(a, b):
-            if a==b:
-                return None
-            if a.parent==b.parent:
-                return True
-            if a.parent==b.parent.parent and b.name=='index.html':
-                return True
-            return False
-        return {str(page.dstpath.relative_to(dstpath.parent)) for page in self.pages if is_siblings(dstpath, page.dstpath)}
-        
-    def get_siblings_not_linked(self, dstpath, hrefs):
-        sibs = self.get_siblings(dstpath)
+    def in_shard(self, page):
+        "page is generated by this build, always true without --shard"
+        return self.shard is None or shard_of(page.dstpath, self.shard[1]) == self.shard[0]
 
-        def href_to_path(href):
-            result = urlparse(href)
-            if result.netloc:
-                return None
-            else:
-                return result.path
-                #return urljoin(str(dstpath), result.path)
+    def is_ignored(self, filepath):
+        return any(R_IGNORE.match(part) for part in filepath.parts)
 
-        links = {href_to_path(href) for href in hrefs} - {None}
-        return list(sibs - links)
+    def walk(self, basedir):
+        """
+        one traversal of basedir, skipping ignored names and everything below ignored directories.
+        yield (path relative to basedir, is_dir), directories before their contents.
+        stat of files go to self.stats.
+        """
+        basedir = Path(basedir)
+        stack = [(str(basedir), None)]
+        while stack:
+            d, rel = stack.pop()
+            try:
+                with os.scandir(d) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError:
+                continue
+            subdirs = []
+            for e in entries:
+                if R_IGNORE.match(e.name):
+                    continue
+                r = rel / e.name if rel else Path(e.name)
+                if e.is_dir():
+                    subdirs.append((e.path, r))
+                    yield r, True
+                elif e.is_file():
+                    self.stats.put(basedir / r, e.stat())
+                    yield r, False
+            stack.extend(reversed(subdirs))
+
+    def scan(self, basedir):
+        "return (files, dirs) of walk(basedir)"
+        files, dirs = [], []
+        for path, is_dir in self.walk(basedir):
+            (dirs if is_dir else files).append(path)
+        return files, dirs
 
-    def generate(self, dstdir, indexupdate):
+    def get_siblings(self, dstpath):
+        d = dstpath.parent
+        if d not in self.siblings:
+            self.siblings[d] = frozenset(str(page.dstpath.relative_to(d)) for page in self.dirs.get(d, ()))
+        return set(self.siblings[d] - {dstpath.name})
+        
+    def get_siblings_not_linked(self, dstpath):
+        "siblings the content of the page does not link to, by the link graph"
+        d = dstpath.parent.as_posix()
+        links = set(self.links.links(dstpath.as_posix()) or ())
+        return sorted(s for s in self.get_siblings(dstpath) if posixpath.normpath(posixpath.join(d, s)) not in links)
+
+    def backlinks(self, dstpath):
+        "urls of the pages linking to dstpath, relative to dstpath"
+        d = dstpath.parent.as_posix()
+        return [posixpath.relpath(source, d) for source in self.links.backlinks(dstpath.as_posix())]
+
+    def generate(self, dstdir, indexupdate, pages=None):
+        """
+        pages: candidates to check for update. None means all pages, and also removes
+        abandoned files from dstdir.
+        with --shard only the pages of the shard are generated, and the search entries
+        go into the shard file for `sitegen merge` instead of the search index.
+        """
         dstdir = Path(dstdir)
-        searchindex_path = 'searchindex.js'
+        self.memo = {}
+        searchindex_path = 'searchindex.js' if self.search_format == 'full' else SEARCH_DIR
         searchindex_update = False
 
         makedirs(dstdir)
-        current_dst = set(self.walk_site(dstdir))
-        next_dst = {Path(searchindex_path)}|{page.dstpath for page in self.pages}
-        deleted_dst = current_dst - next_dst
-
-        if len(deleted_dst) > 0:
-            log(f'delete {len(deleted_dst)} abandoned files from destination directory')
-            for f in deleted_dst:
-                log(f'delete {f}')
-                remove(dstdir/f)
-            searchindex_update = True
-
-        tl = self.template_engine.lastmodified
-
-        def g(page):
-            sm = max(page.lastmodified, tl)
-            if page.need_update(sm, dstdir):
-                #log(f'generating {page.url}...')
-                with report_exceptions():
-                    page.generate(dstdir)
+        if self.fingerprint:
+            with span('fingerprint'):
+                self.fingerprint_assets(dstdir)
+        own = self.pages if self.shard is None else [page for page in self.pages if self.in_shard(page)]
+        next_dst = ({Path(searchindex_path)} if self.shard is None else set())|{p for page in own for p in page.outputs()}
+        next_dst |= {c for f in next_dst if compressible(f) for c in siblings(f, self.compress_formats)}
+        current_dst = set()
+        if pages is None:
+            current_dst = set(self.scan(dstdir)[0])
+            deleted_dst = {f for f in current_dst - next_dst if f.parts[0] != searchindex_path}
+
+            if len(deleted_dst) > 0:
+                log(f'delete {len(deleted_dst)} abandoned files from destination directory')
+                for f in deleted_dst:
+                    log(f'delete {f}')
+                    remove(dstdir/f)
+                searchindex_update = True
+
+        if self.manifest is None or self.manifest.path != dstdir/MANIFEST_FILE:
+            self.manifest = Manifest(dstdir/MANIFEST_FILE)
+            self.stamper = HashStamper(dstdir/HASH_INDEX_FILE, self.stats) if self.hash_mode else MtimeStamper(self.stats)
+        manifest = self.manifest
+        manifest.prune(next_dst)
+
+        if self.links is None or self.links.path != dstdir/LINKS_FILE:
+            self.links = LinkGraph(dstdir/LINKS_FILE)
+        with span('link-scan'):
+            scanned, relinked = self.scan_links()
+        if pages is not None:
+            # pages whose backlinks changed
+            pages = list(pages) + [page for page in own if page.dstpath.as_posix() in relinked]
+
+        def is_stale(page):
+            record = dict(manifest.get(page.dstpath) or {})
+            if record.pop('output', None) != self.stamper.output(dstdir/page.dstpath):
                 return True
-            return False
+            return record != page.dependencies(record.get('templates', ()), record.get('inputs', ()))
+
+        def record(page):
+            self.stats.invalidate(dstdir/page.dstpath)
+            d = page.dependencies(getattr(page, 'templates', ()), getattr(page, 'inputs', ()))
+            d['output'] = self.stamper.output(dstdir/page.dstpath)
+            return d
+
+        with span('stale-check'):
+            stale = self.schedule([page for page in (own if pages is None else set(pages)) if self.in_shard(page) and is_stale(page)])
+        searchindex_update |= len(stale) > 0
+
+        # --stream: a window of pages at a time, so that sources, converted documents and
+        # compressed outputs of the whole site are never in memory together
+        window = STREAM_WINDOW if self.stream else max(len(stale), 1)
+        written = []
+        progress = stale and progress_bar(len(stale))
+        for w in range(0, len(stale), window):
+            batch = stale[w:w+window]
+            # stage 1: external converters, waiting on subprocesses in threads. as many threads as
+            # the supervisor lets processes run, independent of the render workers
+            with span('convert-stage'), concurrent.futures.ThreadPoolExecutor(max_workers=supervisor.max_procs) as executor:
+                self.convert(executor, [page for page in batch if isinstance(page, PageMarkdown) and id(page) not in scanned])
+
+            # stage 2: parse, render and write. cpu bound, in processes if worth it
+            with span('render-stage'):
+                for page, ok, templates, inputs, duration in self.render(batch, dstdir, progress):
+                    manifest.set_duration(page.dstpath, duration)
+                    if ok:
+                        written += page.outputs()
+                        if isinstance(page, PageTemplated):
+                            page.templates = self.shared(('dependencies', *templates), lambda: tuple(templates))
+                            page.inputs = inputs
+                        manifest.set(page.dstpath, record(page))
+
+            if self.stream and self.compress_formats:
+                with span('compress-stage'):
+                    self.compress(dstdir, written)
+                written = []
+        if progress:
+            progress.close()
+        manifest.save()
+        self.links.save()
+
+        with span('link-report'):
+            report = self.links.report(p.as_posix() for page in self.pages for p in page.outputs())
+        log(f'links: {len(report["broken"])} broken, {len(report["orphans"])} pages not linked from other pages')
+        if self.link_report:
+            with open(self.link_report, 'w') as f:
+                json.dump(report, f, indent=1)
+        self.stamper.save()
+
+        search = None
+        if indexupdate and self.shard:
+            with span('search-index'):
+                store = None if self.stream else SearchEntries(dstdir/SEARCH_ENTRIES_FILE)
+                index = self.positions()
+                search = [[index[id(page)], j] for page in own for j in self.search_entries([page], store)]
+                if store:
+                    store.save()
+        elif indexupdate and searchindex_update:
+            log(f'making search index: {searchindex_path}')
+            with span('search-index'):
+                # --stream reads the entries again instead of keeping all of them in a store
+                store = None if self.stream else SearchEntries(dstdir/SEARCH_ENTRIES_FILE)
+                entries = self.search_entries(self.pages, store)
+                if self.search_format == 'ngram':
+                    self.ngram_index(entries).write(dstdir)
+                else:
+                    with open(dstdir/searchindex_path,'w') as f:
+                        write_searchindex(f, entries)
+                if store:
+                    store.save()
+            if self.search_format == 'ngram':
+                written += [f.relative_to(dstdir) for f in (dstdir/SEARCH_DIR).iterdir()]
+            else:
+                written.append(Path(searchindex_path))
+
+        if self.compress_formats:
+            if pages is None:
+                # outputs of earlier builds without (some of) the formats
+                written += [f for f in next_dst if compressible(f) and f in current_dst
+                            and not all(c in current_dst for c in siblings(f, self.compress_formats))]
+            with span('compress-stage'):
+                self.compress(dstdir, written)
+
+        if self.shard:
+            write_shard_file(dstdir, self.shard, self.search_format, self.compress_formats,
+                             [p for p in next_dst if (dstdir/p).is_file()], search)
+
+        if self.cache:
+            removed = self.cache.evict()
+            log(f'conversion cache: {self.cache.hits} hits, {self.cache.misses} misses, {removed} evicted')
+        if supervisor.timeouts or supervisor.failed:
+            log(supervisor.summary())
+        return stale
+
+    def update(self, dstdir, indexupdate, changed):
+        """
+        incremental rebuild after the files in `changed` were modified, created or deleted.
+        return regenerated pages.
+        """
+        changed = {Path(p).resolve() for p in changed}
+        srcdir = self.srcdir.resolve()
+        sources = {srcdir / page.srcpath: page for page in self.pages if not isinstance(page, PageIndex)}
+        config = Path(CONFIG_YAML).resolve()
+        templatedir = self.template_engine.templatedir and Path(self.template_engine.templatedir).resolve()
+
+        # pages which read a changed file other than their source (bibliography)
+        inputs = defaultdict(set)
+        for page in self.pages:
+            for f in (self.manifest and self.manifest.get(page.dstpath) or {}).get('inputs', ()):
+                inputs[Path(f)].add(page)
+
+        candidates = set()
+        structural = False
+        for p in changed:
+            self.stats.invalidate(p)
+            candidates |= inputs.get(p, set())
+            if p == config:
+                self.config = ConfigYaml.from_file(CONFIG_YAML)
+                structural = True
+            elif p.name == DIR_CONFIG_YAML and srcdir in p.parents and not self.is_ignored(p.parent.relative_to(srcdir)):
+                # only the pages below the directory may be affected
+                reldir = p.parent.relative_to(srcdir)
+                self.invalidate_config(reldir)
+                candidates |= {page for page in self.pages if isinstance(page, PageMarkdown)
+                               and (page.srcpath.parent == reldir or reldir in page.srcpath.parents)}
+            elif templatedir and templatedir in p.parents:
+                self.template_engine.reset()
+                structural = True
+            elif srcdir in p.parents and not self.is_ignored(p.relative_to(srcdir)):
+                if p in sources and p.is_file():
+                    candidates.add(sources[p])
+                    self.stats.invalidate(sources[p].srcfile)
+                else:
+                    structural = True
+
+        if structural:
+            # files were added or removed, or every page may depend on the change.
+            # the manifest decides what is actually stale.
+            self.load()
+            return self.generate(dstdir, indexupdate)
+        if candidates:
+            return self.generate(dstdir, indexupdate, list(candidates))
+        return []
+
+    def watch(self, dstdir, indexupdate, on_update=None):
+        "watch sources, templates and config, and rebuild on change until interrupted."
+        from .watch import Watcher
+        # the watcher and the dev server run threads, which fork does not copy safely
+        self.fork_workers = False
+        dirs = [self.srcdir] + ([self.template_engine.templatedir] if self.template_engine.templatedir else [])
+        watcher = Watcher(dirs, [CONFIG_YAML])
+        log(f'watching {", ".join(str(d) for d in dirs)} for changes')
+        try:
+            while True:
+                changed = watcher.wait()
+                with report_exceptions():
+                    updated = self.update(dstdir, indexupdate, changed)
+                    if updated and on_update:
+                        on_update(updated)
+        finally:
+            watcher.close()
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=7) as executor:
-            futures = [executor.submit(g, page) for page in self.pages]
-            for f in tqdm.tqdm(concurrent.futures.as_completed(futures), total=len(futures), unit='file'):
-                pass
-            searchindex_update |= any(f.result() for f in futures)
+    def schedule(self, pages):
+        """
+        order pages longest first by the durations of the last build, so that a huge page
+        does not start last and leave the workers idle. unknown pages count as average.
+        """
+        known = [d for d in (self.manifest.duration(page.dstpath) for page in pages) if d is not None]
+        average = sum(known)/len(known) if known else 0
+        def duration(page):
+            d = self.manifest.duration(page.dstpath)
+            return average if d is None else d
+        return sorted(pages, key=duration, reverse=True)
+
+    def scan_links(self):
+        """
+        scan the links of pages whose source changed since their last scan, converting them.
+        with --shard only the pages of the shard are scanned, the links of the others are
+        taken from the graph of a merged build in links_from, if given.
+        return (ids of the scanned pages, destination paths whose backlinks changed)
+        """
+        documents = [page for page in self.pages if isinstance(page, PageMarkdown)]
+        relinked = self.links.prune(page.dstpath.as_posix() for page in documents)
+        if self.shard and self.links_from:
+            others = [page.dstpath.as_posix() for page in documents if not self.in_shard(page)]
+            relinked |= self.links.update(LinkGraph(Path(self.links_from)/LINKS_FILE), others)
+        todo = [page for page in documents if self.in_shard(page) and self.links.links(page.dstpath.as_posix(), self.stamper.stamp(page.srcfile)) is None]
+        window = STREAM_WINDOW if self.stream else max(len(todo), 1)
+        for w in range(0, len(todo), window):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                relinked |= self.convert(executor, todo[w:w+window], links=True)
+        return {id(page) for page in todo}, relinked
+
+    def convert(self, executor, pages, links=False):
+        """
+        run converters of markdown and asciidoc pages, results are stored in self.cache.
+        links: also record the links of the converted documents in self.links, and return
+        the destination paths whose backlinks changed.
+        """
+        if self.batch_size > 1:
+            self.prefetch(executor, [page for page in pages if page.batch])
+        relinked = []
 
-        if indexupdate and searchindex_update:
-            log(f'making search index: {searchindex_path}')
-            open(dstdir/searchindex_path,'w').write(self.search_index(self.pages))
+        def c(page):
+            with report_exceptions():
+                yaml_src, source = page.read_source()
+                if links:
+                    html, error = page.convert(source)
+                    if html.strip() and not error:
+                        relinked.append(self.links.set(page.dstpath.as_posix(), self.stamper.stamp(page.srcfile), extract_links(html)))
+                else:
+                    # documents without a key are not cached, they are converted when rendered
+                    key = page.cache_key(source)
+                    if key is not None and not self.cache.has(key):
+                        page.convert(source)
+                if 'bibliography' in yaml_src or page.config.get('bibliography'):
+                    # parse bibliographies here, before render workers are forked
+                    with suppress(Exception):
+                        page.bibliography(page.local_config(yaml_src))
+
+        list(executor.map(c, pages))
+        return set().union(*relinked)
+
+    def render(self, pages, dstdir, progress=None):
+        """
+        generate pages, yield (page, ok, templates, inputs, duration).
+        a process pool is used on platforms with fork, where workers inherit the site
+        including the converted documents in self.cache, unless fork_workers is off.
+        the workers' cache hits and misses are added to self.cache.
+        at most jobs*INFLIGHT_PER_JOB pages are submitted ahead of the finished ones.
+        """
+        global _worker_site
+        import multiprocessing
+        index = self.positions()
+        use_processes = self.fork_workers and self.jobs > 1 and len(pages) > self.jobs and 'fork' in multiprocessing.get_all_start_methods()
+        if use_processes:
+            _worker_site = self
+            # created and imported before the fork, shared with the workers
+            supervisor.slots
+            self.template_engine.env
+            import lxml.etree
+            executor = concurrent.futures.ProcessPoolExecutor(self.jobs, mp_context=multiprocessing.get_context('fork'))
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs)
+        bar = progress or progress_bar(len(pages))
+        try:
+            with executor:
+                site = None if use_processes else self
+                todo = iter(pages)
+                pending = set()
+                while True:
+                    for page in itertools.islice(todo, self.jobs*INFLIGHT_PER_JOB - len(pending)):
+                        pending.add(executor.submit(generate_page, index[id(page)], dstdir, site))
+                    if not pending:
+                        break
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for f in done:
+                        i, ok, templates, inputs, duration, events, counts = f.result()
+                        if events:
+                            profile.active().extend(events)
+                        if counts:
+                            with self.cache.lock:
+                                self.cache.hits += counts[0]
+                                self.cache.misses += counts[1]
+                        bar.update(1)
+                        yield self.pages[i], ok, templates, inputs, duration
+        finally:
+            _worker_site = None
+            if not progress:
+                bar.close()
+
+    def prefetch(self, executor, pages):
+        """
+        convert uncached markdown pages in batches and store results in self.cache,
+        so that PageMarkdown.generate hits the cache. failed documents are left to
+        the one-by-one conversion in PageMarkdown.generate.
+        """
+        if not batch_pandoc.available:
+            return
+        todo = {}
+        for page in pages:
+            with report_exceptions():
+                source = page.read_source()[1]
+                key = page.cache_key(source)
+                if key not in todo and not self.cache.has(key):
+                    todo[key] = source.encode(PAGE_ENCODING)
+        if not todo:
+            return
+
+        keys = list(todo)
+        chunks = [keys[i:i+self.batch_size] for i in range(0, len(keys), self.batch_size)]
+        log(f'converting {len(keys)} documents in {len(chunks)} batches')
+
+        def b(chunk):
+            with span('pandoc-batch', documents=len(chunk)):
+                results = batch_pandoc.convert_many([todo[k] for k in chunk], PageMarkdown.pandoc_filters())
+            for key, (data, error) in zip(chunk, results):
+                if data and data.strip():
+                    self.cache.put(key, data)
+
+        for f in concurrent.futures.as_completed([executor.submit(b, chunk) for chunk in chunks]):
+            with report_exceptions():
+                f.result()
+
+    def shared(self, key, make):
+        """
+        make() once per build for key. used for values which are the same for many pages,
+        so that the dependency records of the manifest share them instead of holding copies.
+        """
+        try:
+            return self.memo[key]
+        except KeyError:
+            value = self.memo[key] = make()
+            return value
+
+    def positions(self):
+        "id(page) -> index of the page in self.pages"
+        return self.shared('positions', lambda: {id(page): i for i, page in enumerate(self.pages)})
 
-    def search_index(self, pages):
-        import json
-        jj = [page.search_json for page in pages if page.search_json]
-        return f"var data={json.dumps(jj)}"
+    def fingerprint_assets(self, dstdir):
+        """
+        content digests of static files, for fingerprinted copies and the asset() helper.
+        self.assets = {url: (fingerprinted dstpath, absolute srcfile)}.
+        digests are kept in dstdir/ASSET_INDEX_FILE and only computed for changed files.
+        """
+        digests = HashStamper(dstdir/ASSET_INDEX_FILE, self.stats)
+        self.assets = {}
+        for page in self.pages:
+            if isinstance(page, PageFile) and page.srcpath.suffix in ASSET_SUFFIXES:
+                with report_exceptions():
+                    page.fingerprint = fingerprint_name(page.dstpath, digests.stamp(page.srcfile))
+                    self.assets[page.dstpath.as_posix()] = (page.fingerprint, str(page.srcfile.resolve()))
+        digests.save()
+
+    def compress(self, dstdir, paths):
+        "write compressed siblings of the compressible files in paths, in parallel"
+        paths = sorted({p for p in paths if compressible(p)})
+        if not paths:
+            return
+        log(f'compressing {len(paths)} files: {", ".join(self.compress_formats)}')
+        def c(path):
+            with report_exceptions():
+                compress_file(dstdir/path, self.compress_formats)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            list(executor.map(c, paths))
+
+    def search_entries(self, pages, store=None):
+        "yield search_json of pages, reusing entries in store of pages whose source is unchanged"
+        for page in pages:
+            with report_exceptions():
+                j = store.get(page.dstpath, self.stamper.stamp(page.srcfile), lambda: page.search_json) if store else page.search_json
+                if j:
+                    yield j
+
+    def ngram_index(self, entries):
+        index = NgramIndex()
+        for j in entries:
+            index.add(j['url'], j['title'], j['content'])
+        return index
+
+_worker_site = None
+
+def generate_page(i, dstdir, site=None):
+    "generate site.pages[i]. runs in a worker thread or in a forked worker process."
+    cache = (site or _worker_site).cache
+    page = (site or _worker_site).pages[i]
+    start = time.perf_counter()
+    counts = cache.hits, cache.misses
+    ok = False
+    with report_exceptions(), span('page', page.url):
+        page.generate(dstdir)
+        ok = True
+    # spans and cache counts of a worker process are sent back with the result
+    events = profile.active().drain() if site is None and profile.active() else None
+    counts = (cache.hits - counts[0], cache.misses - counts[1]) if site is None else None
+    return i, ok, getattr(page, 'templates', []), getattr(page, 'inputs', []), time.perf_counter() - start, events, counts
+
+def merge(shard_dirs, dstdir, publish_mode='copy'):
+    """
+    combine the output directories of a `--shard K/N` build into dstdir: outputs,
+    manifest, link graph and search index, and remove files of dstdir which no shard produced.
+    raises ValueError if shard_dirs are not all shards of one build.
+    """
+    shards = read_shards(shard_dirs)
+    dstdir = Path(dstdir)
+    search_format = shards[0][1]['search_format']
+    formats = shards[0][1]['compress']
+    searchindex_path = 'searchindex.js' if search_format == 'full' else SEARCH_DIR
+    makedirs(dstdir)
+
+    manifest = Manifest(dstdir/MANIFEST_FILE)
+    manifest.pages, manifest.durations = {}, {}
+    links = LinkGraph(dstdir/LINKS_FILE)
+    links.pages = {}
+    outputs = set()
+    published = 0
+    for d, data in shards:
+        log(f'merging shard {data["shard"][0]}/{data["shard"][1]}: {len(data["outputs"])} files from {d}')
+        m = Manifest(d/MANIFEST_FILE)
+        manifest.pages.update(m.pages)
+        manifest.durations.update(m.durations)
+        k, n = data['shard']
+        links.pages.update((p, record) for p, record in LinkGraph(d/LINKS_FILE).pages.items() if shard_of(p, n) == k)
+        for p in data['outputs']:
+            with report_exceptions():
+                makedirs((dstdir/p).parent)
+                published += publish(d/p, dstdir/p, publish_mode) is not None
+                outputs.add(Path(p))
+    log(f'{published} files updated')
+    manifest.dirty = True
+    manifest.save()
+    links.dirty = True
+    links.save()
+
+    entries = search_entries(shards)
+    if entries is not None:
+        log(f'making search index: {searchindex_path}')
+        if search_format == 'ngram':
+            index = NgramIndex()
+            for j in entries:
+                index.add(j['url'], j['title'], j['content'])
+            index.write(dstdir)
+            written = [f.relative_to(dstdir) for f in (dstdir/SEARCH_DIR).iterdir()]
+        else:
+            with open(dstdir/searchindex_path, 'w') as f:
+                write_searchindex(f, entries)
+            written = [Path(searchindex_path)]
+        for p in written:
+            outputs.add(p)
+            if formats and compressible(p):
+                compress_file(dstdir/p, formats)
+                outputs |= set(siblings(p, formats))
+
+    current = set()
+    for root, dirs, files in os.walk(dstdir):
+        dirs[:] = [d for d in dirs if not R_IGNORE.match(d)]
+        current |= {Path(root, f).relative_to(dstdir) for f in files if not R_IGNORE.match(f)}
+    deleted = {f for f in current - outputs if f.parts[0] != searchindex_path}
+    if deleted:
+        log(f'delete {len(deleted)} abandoned files from destination directory')
+        for f in sorted(deleted):
+            log(f'delete {f}')
+            remove(dstdir/f)
+
+def main_merge(argv):
+    from argparse import ArgumentParser
+    parser = ArgumentParser(prog='sitegen merge', description='combine the outputs of a sharded build (--shard K/N) into one output directory')
+    parser.add_argument("shards", nargs='+', metavar="SHARD_DIR", help="output directories of all shards")
+    parser.add_argument("-o", "--output", dest="outputdir", help="output directory", default="_output")
+    parser.add_argument("--publish", dest="publish_mode", choices=PUBLISH_MODES, help="how files are put into the output directory (falls back to copy)", default='copy')
+    args = parser.parse_args(argv)
+    try:
+        merge(args.shards, args.outputdir, args.publish_mode)
+    except ValueError as e:
+        parser.error(str(e))
 
 def main():
+    if sys.argv[1:2] == ['merge']:
+        return main_merge(sys.argv[2:])
+
     from argparse import ArgumentParser
     parser = ArgumentParser(prog='sitegen', description='generating html static site from markdown documents')
     parser.add_argument("inputdir", help="input directory")
     parser.add_argument("-o", "--output", dest="outputdir", help="output directory", default="_output")
     parser.add_argument("-t", "--template", dest="templatedir", help="template directory", default=None)
     parser.add_argument("-i", dest="index_update",action='store_true', help="update search index")
+    parser.add_argument("--cache", dest="cachedir", help="conversion cache directory", default=CACHE_DIR)
+    parser.add_argument("--cache-size", dest="cache_size", type=int, help="conversion cache size limit in MB", default=DEFAULT_MAX_SIZE//(1024*1024))
+    parser.add_argument("--no-cache", dest="cachedir", action='store_const', const=None, help="disable conversion cache")
+    parser.add_argument("--hash", dest="hash_mode", action='store_true', help="detect changes by content digest instead of mtime")
+    parser.add_argument("-w", "--watch", dest="watch", action='store_true', help="keep running and rebuild on change")
+    parser.add_argument("-s", "--serve", dest="serve", action='store_true', help="serve output directory with live reload")
+    parser.add_argument("-p", "--port", dest="port", type=int, help="port of --serve", default=8000)
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, help="number of parallel workers (default: number of cpus)", default=None)
+    parser.add_argument("--search-index", dest="search_format", choices=['full', 'ngram'], help="search index format: full text in searchindex.js, or sharded trigram index loaded on demand", default='full')
+    parser.add_argument("--publish", dest="publish_mode", choices=PUBLISH_MODES, help="how static files are put into the output directory (falls back to copy)", default='copy')
+    parser.add_argument("--compress", dest="compress", metavar="FORMATS", help="write precompressed siblings of html/css/js outputs, comma separated: gz,br", default='')
+    parser.add_argument("--fingerprint", dest="fingerprint", action='store_true', help="also publish static files under content-hashed names, used by asset() in templates")
+    parser.add_argument("--minify", dest="minify", action='store_true', help="minify rendered html and unminified css/js")
+    parser.add_argument("--stream", dest="stream", action='store_true', help="bounded memory for very large sites: convert and render a window of pages at a time, search entries are not cached")
+    parser.add_argument("--link-report", dest="link_report", metavar="JSON", help="write broken links and pages not linked from other pages", default=None)
+    parser.add_argument("--shard", dest="shard", metavar="K/N", help="build only shard K of N (1 <= K <= N) for `sitegen merge`", default=None)
+    parser.add_argument("--links-from", dest="links_from", metavar="DIR", help="with --shard: output directory of a merged build, for the links of the other shards' pages", default=None)
+    parser.add_argument("--profile", dest="profile", metavar="TRACE_JSON", help="write per-page phase timing as a chrome trace and print a summary", default=None)
+    parser.add_argument("--timeout", dest="timeout", type=float, help="seconds an external converter may run before it is killed (0: no limit)", default=DEFAULT_TIMEOUT)
+    parser.add_argument("--retries", dest="retries", type=int, help="runs of a converter call which timed out or crashed, after the first", default=DEFAULT_RETRIES)
+    parser.add_argument("--max-procs", dest="max_procs", type=int, help="number of concurrent external converter processes (default: number of cpus)", default=None)
+    parser.add_argument("--batch", dest="batch_size", type=int, help="number of documents converted per pandoc process (0: one process per page)", default=BATCH_SIZE)
 
     args = parser.parse_args()
 
@@ -542,5 +1578,45 @@ def main():
         parser.error('no input directory')
         return
 
-    site = Site(args.inputdir, args.templatedir)
+    try:
+        compress = parse_formats(args.compress)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        shard = args.shard and parse_shard(args.shard)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.profile:
+        profile.start()
+    supervisor.configure(args.max_procs, args.timeout, args.retries)
+
+    site = Site(args.inputdir, args.templatedir, cachedir=args.cachedir, cache_size=args.cache_size*1024*1024,
+                batch_size=args.batch_size, hash_mode=args.hash_mode, jobs=args.jobs, search_format=args.search_format,
+                publish_mode=args.publish_mode, compress=compress, fingerprint=args.fingerprint, minify=args.minify,
+                stream=args.stream, shard=shard, link_report=args.link_report, links_from=args.links_from)
     site.generate(args.outputdir, args.index_update)
+
+    if args.profile:
+        p = profile.stop()
+        p.write(args.profile)
+        for line in p.summary(site.jobs):
+            log(line)
+        log(f'trace written to {args.profile}')
+
+    server = None
+    if args.serve:
+        from .server import DevServer
+        server = DevServer(args.outputdir, args.port)
+        server.start()
+        log(f'serving {args.outputdir} at {server.url}')
+    try:
+        if args.watch:
+            site.watch(args.outputdir, args.index_update, server and (lambda pages: server.reload()))
+        elif server:
+            threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server:
+            server.shutdown()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+# supervised runs of external converters (pandoc, pandoc filters, asciidoctor):
+#   - a timeout per call. the process and its children (filters) are killed when it runs over
+#   - a cap on concurrently running processes, independent of the number of render workers
+#   - bounded retries of calls which timed out or were killed by a signal. a call which still
+#     fails raises ConverterError with the captured stderr, and is not run again by this
+#     process, so that one bad page costs at most (retries+1) * timeout once per build.
+#
+# the cap is a multiprocessing semaphore, shared with render workers forked after first use.
+
+import os, json, shutil, signal, hashlib, threading, subprocess
+from .cache import user_cache_dir
+
+DEFAULT_TIMEOUT = 120
+DEFAULT_RETRIES = 1
+STDERR_TAIL = 2000
+
+def decode(data, encoding='UTF-8'):
+    return (data or b'').decode(encoding, 'replace')
+
+def probe_cached(name, commands, probe):
+    """
+    probe() -> json data about the commands, e.g. versions and formats. cached in the user's
+    cache directory keyed by the paths, mtimes and sizes of the commands' binaries on PATH, so
+    that it runs once per installation instead of once per build.
+    """
+    stamps = []
+    for command in commands:
+        path = shutil.which(command)
+        try:
+            st = os.stat(path)
+            stamps.append([os.path.realpath(path), st.st_mtime_ns, st.st_size])
+        except (OSError, TypeError):
+            stamps.append(None)
+    key = hashlib.sha256(json.dumps([name, stamps]).encode()).hexdigest()[:16]
+    try:
+        path = os.path.join(user_cache_dir(), f'probe-{name}-{key}.json')
+    except OSError:
+        return probe()
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    data = probe()
+    try:
+        tmp = f'{path}.{os.getpid()}'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return data
+
+class ConverterError(RuntimeError):
+    "external converter timed out or crashed on every try"
+    def __init__(self, args, message, stderr=''):
+        self.command = list(args)
+        self.stderr = stderr[-STDERR_TAIL:].strip()
+        super().__init__(f'{os.path.basename(args[0])}: {message}' + (f'\n{self.stderr}' if self.stderr else ''))
+
+class Supervisor:
+    def __init__(self, max_procs=None, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES):
+        self.lock = threading.Lock()
+        self.failed = {}
+        self.runs = 0
+        self.timeouts = 0
+        self.configure(max_procs, timeout, retries)
+
+    def configure(self, max_procs=None, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES):
+        "max_procs: concurrent processes (default: number of cpus). timeout: seconds, 0 for none"
+        self.max_procs = max_procs or os.cpu_count() or 1
+        self._slots = None
+        self.timeout = timeout
+        self.retries = retries
+
+    @property
+    def slots(self):
+        with self.lock:
+            if self._slots is None:
+                try:
+                    import multiprocessing
+                    self._slots = multiprocessing.BoundedSemaphore(self.max_procs)
+                except (OSError, ImportError):
+                    # no shared memory: per process cap
+                    self._slots = threading.BoundedSemaphore(self.max_procs)
+            return self._slots
+
+    def key(self, args, input, cwd):
+        h = hashlib.sha256(repr((list(args), str(cwd))).encode())
+        h.update(input or b'')
+        return h.hexdigest()
+
+    def run(self, args, input=None, cwd=None, timeout=None, retries=None):
+        """
+        run args with input bytes, return subprocess.CompletedProcess with stdout and stderr bytes
+        of any exit status. raises OSError if the command is not found, ConverterError if it timed
+        out or was killed on every try.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        key = self.key(args, input, cwd)
+        with self.lock:
+            error = self.failed.get(key)
+        if error is not None:
+            raise error
+        for attempt in range(retries + 1):
+            with self.slots:
+                with self.lock:
+                    self.runs += 1
+                p = self.run_once(args, input, cwd, timeout)
+            if p is None:
+                error = ConverterError(args, f'timed out after {timeout}s')
+            elif p.returncode < 0:
+                error = ConverterError(args, f'killed by signal {-p.returncode}', decode(p.stderr))
+            else:
+                return p
+        with self.lock:
+            self.failed[key] = error
+        raise error
+
+    def run_once(self, args, input, cwd, timeout):
+        "CompletedProcess, None if it timed out"
+        proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                cwd=cwd, start_new_session=hasattr(os, 'killpg'))
+        try:
+            out, err = proc.communicate(input, timeout=timeout or None)
+        except subprocess.TimeoutExpired:
+            self.kill(proc)
+            proc.communicate()
+            with self.lock:
+                self.timeouts += 1
+            return None
+        return subprocess.CompletedProcess(args, proc.returncode, out, err)
+
+    @staticmethod
+    def kill(proc):
+        "kill proc and the processes it started"
+        try:
+            if hasattr(os, 'killpg'):
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except OSError:
+            pass
+
+    def summary(self):
+        with self.lock:
+            return f'external processes: {self.runs} runs, {self.timeouts} timed out, {len(self.failed)} failed'
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+# file system watchers for `sitegen --watch`.
+# InotifyWatcher uses linux inotify through ctypes, PollingWatcher is the portable fallback.
+
+import os, sys, time, struct, select, ctypes, ctypes.util
+from pathlib import Path
+
+DEBOUNCE = 0.05
+
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_IGNORED = 0x8000
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT = struct.Struct('iIII')
+
+class PollingWatcher:
+    """
+        watch directories recursively and single files by polling stat.
+        wait() blocks until something changed and returns the set of changed paths.
+    """
+    def __init__(self, dirs, files=(), interval=0.3):
+        self.dirs = [Path(d) for d in dirs]
+        self.files = [Path(f) for f in files]
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self):
+        snap = {}
+        def add(p):
+            try:
+                st = os.stat(p)
+                snap[p] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                pass
+        for d in self.dirs:
+            for root, dirs, files in os.walk(d):
+                for name in files:
+                    add(Path(root) / name)
+        for f in self.files:
+            add(f)
+        return snap
+
+    def wait(self, timeout=None):
+        start = time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            snap = self.scan()
+            changed = {p for p in snap.keys() | self.snapshot.keys() if snap.get(p) != self.snapshot.get(p)}
+            self.snapshot = snap
+            if changed or (timeout is not None and time.monotonic() - start >= timeout):
+                return changed
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    "same interface as PollingWatcher, driven by inotify events."
+    def __init__(self, dirs, files=()):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.wds = {}
+        self.files = {}
+        for d in dirs:
+            for root, subdirs, _ in os.walk(d):
+                self.add_watch(Path(root))
+        for f in files:
+            f = Path(f)
+            self.add_watch(f.parent, recursive=False)
+            self.files.setdefault(f.parent, set()).add(f.name)
+
+    def add_watch(self, path, recursive=True):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            return
+        prev = self.wds.get(wd)
+        self.wds[wd] = (path, recursive or (prev is not None and prev[1]))
+
+    def read_events(self):
+        changed = set()
+        buf = os.read(self.fd, 64 * 1024)
+        pos = 0
+        while pos < len(buf):
+            wd, mask, cookie, length = EVENT.unpack_from(buf, pos)
+            name = buf[pos + EVENT.size:pos + EVENT.size + length].rstrip(b'\0')
+            pos += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                changed |= {path for path, _ in self.wds.values()}
+                continue
+            if wd not in self.wds:
+                continue
+            path, recursive = self.wds[wd]
+            if mask & IN_IGNORED:
+                del self.wds[wd]
+                continue
+            if not name:
+                changed.add(path)
+                continue
+            p = path / os.fsdecode(name)
+            if not recursive and p.name not in self.files.get(path, ()):
+                continue
+            if recursive and mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                for root, subdirs, _ in os.walk(p):
+                    self.add_watch(Path(root))
+            changed.add(p)
+        return changed
+
+    def wait(self, timeout=None):
+        changed = set()
+        while not changed:
+            r, _, _ = select.select([self.fd], [], [], timeout)
+            if not r:
+                return changed
+            changed |= self.read_events()
+        # collect the rest of a burst (editors write, rename and chmod in a row)
+        while select.select([self.fd], [], [], DEBOUNCE)[0]:
+            changed |= self.read_events()
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+def Watcher(dirs, files=()):
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(dirs, files)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(dirs, files)
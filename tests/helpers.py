@@ -0,0 +1,72 @@
+import io, os, re, tempfile, unittest, contextlib
+from html import escape
+from pathlib import Path
+from sitegen import sitegen
+
+@contextlib.contextmanager
+def chdir(path):
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+class StandinPandoc(sitegen.Pandoc):
+    "markdown -> standalone html5 in python: headings, links and paragraphs. converted sources are kept in calls."
+    R_HEADING = re.compile(r'^(#{1,6})\s+(.*)$')
+    R_LINK = re.compile(r'\[([^\]]*)\]\(([^)]*)\)')
+
+    def __init__(self):
+        self.src_fmts = ['markdown']
+        self.dst_fmts = ['html5']
+        self.version = 'standin'
+        self.calls = []
+
+    def convert(self, src, src_format, dst_format, extra_args=[], cwd=None):
+        self.check_format(src_format, dst_format)
+        text = src.decode(sitegen.PAGE_ENCODING) if isinstance(src, bytes) else src
+        self.calls.append(text)
+        blocks = []
+        for n, block in enumerate(re.split(r'\n\s*\n', text.strip())):
+            block = self.R_LINK.sub(lambda m: f'<a href="{escape(m[2])}">{m[1]}</a>', escape(block, quote=False))
+            m = self.R_HEADING.match(block)
+            blocks.append(f'<h{len(m[1])} id="h{n}">{m[2]}</h{len(m[1])}>' if m else f'<p>{block}</p>')
+        body = '\n'.join(blocks)
+        return f'<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8" />\n</head>\n<body>\n{body}\n</body>\n</html>\n', ''
+
+def write_files(files):
+    "write {path: text} relative to the working directory"
+    for path, text in files.items():
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).write_text(text)
+
+def linked_pages(n, dirs=2):
+    "files of n markdown pages in dirs directories, each linking to the next one, and a stylesheet"
+    names = [f'd{i % dirs}/p{i}' for i in range(n)]
+    files = {f'src/{name}.md': f'# page {i}\n\n[next](/{names[(i+1) % n]}.html)\n\ntext of page {i}\n' for i, name in enumerate(names)}
+    files['src/css/site.css'] = 'body { color: black; }\n'
+    return files
+
+class SiteTestCase(unittest.TestCase):
+    """
+    runs in a temporary directory with config.yaml as the working directory, stderr captured,
+    and sitegen.pandoc replaced by StandinPandoc (self.pandoc), so that pandoc is not needed.
+    """
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        self.addCleanup(setattr, sitegen, 'pandoc', sitegen.pandoc)
+        sitegen.pandoc = self.pandoc = StandinPandoc()
+        context = contextlib.ExitStack()
+        self.addCleanup(context.close)
+        context.enter_context(chdir(self.root))
+        context.enter_context(contextlib.redirect_stderr(io.StringIO()))
+        Path('config.yaml').write_text('sitename: test\n')
+
+    def make_site(self, **kwargs):
+        "Site of src and _templates, without conversion cache and batches, in one job unless given"
+        options = dict(cachedir=None, batch_size=0, jobs=1)
+        options.update(kwargs)
+        return sitegen.Site('src', '_templates', **options)
@@ -0,0 +1,87 @@
+import unittest
+from unittest import mock
+from pathlib import Path
+from sitegen import sitegen
+from sitegen.asciidoc import Asciidoctor
+from sitegen.supervisor import Supervisor, ConverterError
+from .helpers import SiteTestCase, write_files
+
+asciidoctor = Asciidoctor(size=2)
+
+@unittest.skipUnless(asciidoctor.available and asciidoctor.persistent, 'asciidoctor gem not installed')
+class TestAsciidoctor(unittest.TestCase):
+    def test_convert(self):
+        html, error = asciidoctor.convert('= Title\n\n== Section\n\nあ\n'.encode('UTF-8'), '.')
+        self.assertEqual(error, '')
+        self.assertIn('<title>Title</title>', html)
+        self.assertIn('あ', html)
+
+    def test_restart(self):
+        asciidoctor.convert(b'= A\n', '.')
+        for w in asciidoctor.workers:
+            w.proc.kill()
+            w.proc.wait()
+        html, error = asciidoctor.convert(b'= B\n', '.')
+        self.assertEqual(error, '')
+        self.assertIn('<title>B</title>', html)
+
+class TestSlots(unittest.TestCase):
+    def test_slots(self):
+        # a worker converting a document takes one of the supervisor's process slots
+        supervisor = Supervisor(max_procs=1)
+        a = Asciidoctor(supervisor=supervisor)
+        a.probed, a.version, a.persistent = True, 'asciidoctor 2', True
+        held = []
+        class Worker:
+            def convert(self, src, base_dir, timeout=None):
+                held.append(not supervisor.slots.acquire(False))
+                return '<html></html>', ''
+        with mock.patch.object(a, 'acquire', return_value=Worker()):
+            self.assertEqual(a.convert(b'= A\n', '.'), ('<html></html>', ''))
+        self.assertEqual(held, [True])
+        self.assertEqual(supervisor.runs, 1)
+        self.assertTrue(supervisor.slots.acquire(False))
+
+    def test_timeout(self):
+        # a document which times out on every try is a failure of the supervisor, converted once
+        supervisor = Supervisor(max_procs=1, retries=1)
+        a = Asciidoctor(supervisor=supervisor)
+        a.probed, a.version, a.persistent = True, 'asciidoctor 2', True
+        class Worker:
+            def convert(self, src, base_dir, timeout=None):
+                raise TimeoutError('timed out')
+            def close(self):
+                pass
+        with mock.patch.object(a, 'acquire', return_value=Worker()):
+            self.assertRaises(ConverterError, a.convert, b'= A\n', '.')
+            self.assertRaises(ConverterError, a.convert, b'= A\n', '.')
+        self.assertEqual(supervisor.summary(), 'external processes: 2 runs, 2 timed out, 1 failed')
+
+class TestIncludes(SiteTestCase):
+    def test_cache_key(self):
+        with mock.patch.multiple(sitegen.asciidoctor, probed=True, version='asciidoctor 2'):
+            Path('src/a').mkdir(parents=True)
+            Path('src/b').mkdir(parents=True)
+            write_files({'src/_parts/part.adoc': 'part\n\ninclude::inner.adoc[]\n', 'src/_parts/inner.adoc': 'inner\n'})
+            source = '= Doc\n\ninclude::../_parts/part.adoc[]\n'
+            site = self.make_site()
+            a, b = (sitegen.PageAsciidoc(site, Path(d, 'doc.adoc')) for d in ['a', 'b'])
+            self.assertEqual(a.includes(source), [Path('src/_parts/part.adoc').resolve(), Path('src/_parts/inner.adoc').resolve()])
+            # same text in another directory
+            self.assertNotEqual(a.cache_key(source), b.cache_key(source))
+            key = a.cache_key(source)
+            Path('src/_parts/inner.adoc').write_text('inner edited\n')
+            self.assertNotEqual(a.cache_key(source), key)
+            self.assertIsNone(a.cache_key('include::{partsdir}/part.adoc[]\n'))
+            with mock.patch.object(sitegen.asciidoctor, 'convert', return_value=('<html></html>', '')) as convert:
+                a.inputs = []
+                a.convert(source)
+                a.convert(source)
+                self.assertEqual(convert.call_count, 1)
+                self.assertEqual(a.inputs, [str(p) for p in a.includes(source)])
+                a.convert('include::{partsdir}/part.adoc[]\n')
+                a.convert('include::{partsdir}/part.adoc[]\n')
+                self.assertEqual(convert.call_count, 3)
+
+if __name__ == '__main__':
+    unittest.main()
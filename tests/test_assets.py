@@ -0,0 +1,24 @@
+import unittest
+from pathlib import Path
+from sitegen.assets import fingerprint_name, minifiable, minify_css, minify_html
+
+class TestAssets(unittest.TestCase):
+    def test_fingerprint_name(self):
+        self.assertEqual(fingerprint_name(Path('css/my.css'), 'abcdef0123456789'), Path('css/my.abcdef0123.css'))
+        self.assertEqual(fingerprint_name('js/a.min.js', '0' * 64), Path('js/a.min.0000000000.js'))
+
+    def test_minifiable(self):
+        self.assertTrue(minifiable('css/my.css'))
+        self.assertFalse(minifiable('css/bootstrap.min.css'))
+        self.assertFalse(minifiable('a.png'))
+
+    def test_minify_css(self):
+        src = '/* c */\na , b {\n  color : red ;\n  content: " /* x */  { } ";\n}\n/*! license */\ndiv :hover { x: 1 }\n'
+        self.assertEqual(minify_css(src), 'a,b{color :red;content:" /* x */  { } ";}/*! license */ div :hover{x:1}')
+
+    def test_minify_html(self):
+        src = '<html>\n  <body>\n    <!-- c -->\n    <p>a   b</p>\n    <pre>x\n   y</pre>\n<!--[if IE]>ie<![endif]-->\n</body>\n</html>'
+        self.assertEqual(minify_html(src), '<html>\n<body>\n\n<p>a b</p>\n<pre>x\n   y</pre>\n<!--[if IE]>ie<![endif]-->\n</body>\n</html>')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import os, tempfile, unittest
+from unittest import mock
+from pathlib import Path
+from sitegen.batch import BatchPandoc, BATCH_LUA
+
+class TestBatchPandoc(unittest.TestCase):
+    def test_check_version(self):
+        self.assertTrue(BatchPandoc.check_version('pandoc 3.1.2'))
+        self.assertFalse(BatchPandoc.check_version('pandoc 2.1.1'))
+        self.assertFalse(BatchPandoc.check_version(''))
+
+    def test_parse(self):
+        b = BatchPandoc('pandoc 3.0')
+        out = 'ok 10\n<p>あ</p>err 3\nbadok 0\n'.encode('UTF-8')
+        self.assertEqual(b.parse(out), [('<p>あ</p>', ''), (None, 'bad'), ('', '')])
+
+    def test_write_script(self):
+        with tempfile.TemporaryDirectory() as d, mock.patch.dict(os.environ, XDG_CACHE_HOME=d):
+            script = BatchPandoc('pandoc 3.0').write_script()
+            self.assertEqual(Path(script).parent, Path(d, 'sitegen'))
+            # a file which is not the driver is replaced
+            Path(script).write_text('os.exit(1)')
+            self.assertEqual(Path(BatchPandoc('pandoc 3.0').write_script()).read_text(), BATCH_LUA)
+            # not writable: a private temporary file
+            with mock.patch('sitegen.batch.user_cache_dir', side_effect=PermissionError):
+                script = BatchPandoc('pandoc 3.0').write_script()
+            self.assertNotEqual(Path(script).parent, Path(d, 'sitegen'))
+            self.assertEqual((Path(script).read_text(), os.stat(script).st_mode & 0o777), (BATCH_LUA, 0o600))
+            os.remove(script)
+
+if __name__ == '__main__':
+    unittest.main()
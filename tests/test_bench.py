@@ -0,0 +1,49 @@
+import os, tempfile, unittest
+from sitegen import sitegen
+from benchmarks.synth import SiteSpec, make_site
+from benchmarks.bench import Bench
+
+class TestBench(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pandoc = sitegen.pandoc
+
+    def tearDown(self):
+        sitegen.pandoc = self.pandoc
+        self.tmp.cleanup()
+
+    def test_synth(self):
+        spec = SiteSpec(pages=10, depth=2, assets=3, asset_size=100)
+        a = make_site(os.path.join(self.tmp.name, 'a'), spec)
+        b = make_site(os.path.join(self.tmp.name, 'b'), spec)
+        self.assertEqual(a, b)
+        self.assertEqual(len(a), 10)
+        for p in a:
+            with open(os.path.join(self.tmp.name, 'a', 'src', p)) as fa, open(os.path.join(self.tmp.name, 'b', 'src', p)) as fb:
+                self.assertEqual(fa.read(), fb.read())
+
+    def test_scenarios(self):
+        spec = SiteSpec(pages=6, depth=1, page_size=500, assets=2, asset_size=100)
+        bench = Bench(os.path.join(self.tmp.name, 'site'), spec, jobs=1)
+        results = bench.run(repeat=1)
+        rebuilt = {k: v['runs'][0]['rebuilt'] for k, v in results.items()}
+        self.assertEqual(rebuilt['noop'], 0)
+        self.assertEqual(rebuilt['edit'], 1)
+        self.assertEqual(rebuilt['template'], 6)
+        self.assertEqual(results['cold']['runs'][0]['rebuilt'], results['cold']['runs'][0]['pages'])
+
+    def test_stream(self):
+        spec = SiteSpec(pages=6, depth=1, page_size=500, assets=2, asset_size=100)
+        bench = Bench(os.path.join(self.tmp.name, 'site'), spec, jobs=2, stream=True)
+        window = sitegen.STREAM_WINDOW
+        sitegen.STREAM_WINDOW = 2
+        try:
+            results = bench.run(['cold', 'noop', 'edit'], repeat=1)
+        finally:
+            sitegen.STREAM_WINDOW = window
+        cold = results['cold']['runs'][0]
+        self.assertEqual(cold['rebuilt'], cold['pages'])
+        self.assertEqual(results['noop']['runs'][0]['rebuilt'], 0)
+        self.assertEqual(results['edit']['runs'][0]['rebuilt'], 1)
+        for p in bench.paths:
+            self.assertTrue(os.path.isfile(os.path.join(bench.root, '_output', os.path.splitext(p)[0] + '.html')))
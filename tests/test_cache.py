@@ -0,0 +1,30 @@
+import os, tempfile, unittest
+from sitegen.cache import ConversionCache, digest
+
+class TestConversionCache(unittest.TestCase):
+    def test_digest(self):
+        self.assertEqual(digest('a', b'b'), digest(b'a', 'b'))
+        self.assertNotEqual(digest('ab'), digest('a', 'b'))
+
+    def test_get_put(self):
+        with tempfile.TemporaryDirectory() as d:
+            c = ConversionCache(d)
+            k = digest('source')
+            self.assertIsNone(c.get(k))
+            c.put(k, '<p>日本語</p>')
+            self.assertEqual(c.get(k), '<p>日本語</p>')
+            self.assertEqual((c.hits, c.misses), (1, 1))
+
+    def test_evict(self):
+        with tempfile.TemporaryDirectory() as d:
+            c = ConversionCache(d, max_size=25)
+            keys = [digest(str(i)) for i in range(3)]
+            for i, k in enumerate(keys):
+                c.put(k, 'x'*10)
+                os.utime(c.path(k), (i, i))
+            self.assertEqual(c.evict(), 1)
+            self.assertIsNone(c.get(keys[0]))
+            self.assertIsNotNone(c.get(keys[2]))
+
+if __name__ == '__main__':
+    unittest.main()
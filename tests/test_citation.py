@@ -0,0 +1,55 @@
+import os, tempfile, unittest
+from pathlib import Path
+from sitegen import citation
+from sitegen.citation import Bibliographies, resolve_csl
+from sitegen.manifest import stamp
+
+try:
+    import citeproc
+except ImportError:
+    citeproc = None
+
+BIB = """@article{Doe:2001,
+author = {Doe, John},
+title = {{A title}},
+journal = {Journal},
+year = {2001}
+}
+"""
+
+@unittest.skipUnless(citeproc, 'citeproc-py not installed')
+class TestCitation(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.bib = Path(self.tmp.name) / 'my.bib'
+        self.bib.write_text(BIB)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_render(self):
+        b = Bibliographies(stamp).get(self.bib)
+        warnings = []
+        html = b.render('<body><p><span class="citation" data-cites="Doe:2001 None:1">[@Doe:2001; @None:1]</span></p>\n<div id="refs"></div></body>', warnings.append)
+        self.assertNotIn('[@', html)
+        self.assertIn('data-cites="Doe:2001 None:1">(Doe, 2001', html)
+        self.assertIn('<div class="csl-entry">Doe, J.', html)
+        self.assertEqual(html.count('id="refs"'), 1)
+        self.assertEqual(len(warnings), 1)
+        self.assertEqual(b.render('<p>none</p>'), '<p>none</p>')
+
+    def test_shared(self):
+        bibs = Bibliographies(stamp)
+        a = bibs.get(self.bib)
+        self.assertIs(bibs.get(self.bib), a)
+        os.utime(self.bib, ns=(0, 0))
+        self.assertIsNot(bibs.get(self.bib), a)
+
+    def test_resolve_csl(self):
+        (Path(self.tmp.name) / 'x.csl').write_text('')
+        self.assertEqual(resolve_csl('x.csl', self.tmp.name), (Path(self.tmp.name) / 'x.csl').resolve())
+        self.assertEqual(resolve_csl('apa', self.tmp.name), 'apa')
+        self.assertIsNone(resolve_csl(None, self.tmp.name))
+
+if __name__ == '__main__':
+    unittest.main()
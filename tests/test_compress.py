@@ -0,0 +1,40 @@
+import os, gzip, tempfile, unittest
+from pathlib import Path
+from sitegen.compress import compressible, siblings, compress_file, parse_formats
+from .helpers import SiteTestCase, write_files
+
+class TestCompress(unittest.TestCase):
+    def test_siblings(self):
+        self.assertTrue(compressible(Path('a/b.html')))
+        self.assertFalse(compressible(Path('a/b.png')))
+        self.assertEqual(siblings(Path('a/b.js'), ['gz', 'br']), [Path('a/b.js.gz'), Path('a/b.js.br')])
+        self.assertEqual(parse_formats(''), [])
+        self.assertEqual(parse_formats('gz'), ['gz'])
+        self.assertRaises(ValueError, parse_formats, 'zip')
+
+    def test_compress_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            p = Path(tmp) / 'a.html'
+            p.write_text('<p>hello</p>' * 100)
+            self.assertEqual(compress_file(p, ['gz']), [Path(tmp) / 'a.html.gz'])
+            gz = (Path(tmp) / 'a.html.gz').read_bytes()
+            self.assertEqual(gzip.decompress(gz), p.read_bytes())
+            self.assertEqual(os.stat(p).st_mtime_ns, os.stat(Path(tmp) / 'a.html.gz').st_mtime_ns)
+            compress_file(p, ['gz'])
+            self.assertEqual((Path(tmp) / 'a.html.gz').read_bytes(), gz)
+            self.assertEqual(sorted(os.listdir(tmp)), ['a.html', 'a.html.gz'])
+
+class TestCompressSite(SiteTestCase):
+    def test_site(self):
+        # compression turned on with an incremental edit: the unchanged outputs are compressed too
+        write_files({f'src/{name}.md': f'# {name}\n' for name in 'abc'})
+        self.make_site().generate('_output', True)
+        self.assertEqual(list(Path('_output').rglob('*.gz')), [])
+        Path('src/a.md').write_text('# a edited\n')
+        stale = self.make_site(compress=['gz']).generate('_output', True)
+        self.assertEqual([str(page.dstpath) for page in stale], ['a.html'])
+        for name in ['a.html', 'b.html', 'c.html', 'searchindex.js']:
+            self.assertEqual(gzip.decompress(Path('_output', name + '.gz').read_bytes()), Path('_output', name).read_bytes())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+from pathlib import Path
+from sitegen.sitegen import ConfigYaml, LocalConfigYaml
+from .helpers import SiteTestCase, write_files
+
+TEMPLATE = '{% extends "base.j2.html" %}{% block main %}<p id="color">{{color}}/{{shape}}</p>{% endblock %}'
+
+class TestConfig(SiteTestCase):
+    def test_cascade(self):
+        root = ConfigYaml('config.yaml', 'sitename: s\n')
+        d = LocalConfigYaml('/src/sub/_config.yaml', 'toc: true\nbib: refs.bib\n', root)
+        page = LocalConfigYaml('/src/sub/dir/a.md', 'toc: false\n', d)
+        self.assertEqual([page.get('toc'), page.get('sitename'), page.get('missing')], [False, 's', None])
+        self.assertEqual(page.merged, {'toc': False, 'bib': 'refs.bib'})
+        self.assertEqual(page.get_fullpath('bib'), Path('/src/sub/refs.bib').resolve())
+        self.assertEqual(page.basedir('bib'), Path('/src/sub'))
+        self.assertIsNone(page.get_fullpath('missing'))
+        self.assertNotEqual(page.cascade_digest, LocalConfigYaml('/src/a.md', 'toc: false\n', root).cascade_digest)
+        self.assertEqual(LocalConfigYaml('a.md', '- a list\n', root).metadata, {})
+
+    def test_site(self):
+        write_files({
+            '_templates/markdown.j2.html': TEMPLATE,
+            'src/_config.yaml': 'color: red\nshape: square\n',
+            'src/sub/_config.yaml': 'color: blue\n',
+            'src/a.md': '# a\n',
+            'src/sub/b.md': '# b\n',
+            'src/sub/deep/c.md': '---\ncolor: green\n---\n# c\n',
+            'src/other/d.md': '# d\n',
+        })
+        color = lambda p: Path('_output', p).read_text().split('<p id="color">')[1].split('</p>')[0]
+
+        site = self.make_site()
+        site.generate('_output', False)
+        self.assertEqual([color(p) for p in ['a.html', 'sub/b.html', 'sub/deep/c.html', 'other/d.html']],
+                         ['red/square', 'blue/square', 'green/square', 'red/square'])
+        self.assertFalse(Path('_output/_config.yaml').exists())
+        self.assertIs(site.dir_config(Path('sub/deep')), site.dir_config(Path('sub')))
+
+        Path('src/sub/_config.yaml').write_text('color: blue\nshape: circle\n')
+        updated = site.update('_output', False, ['src/sub/_config.yaml'])
+        self.assertEqual(sorted(str(page.dstpath) for page in updated), ['sub/b.html', 'sub/deep/c.html'])
+        self.assertEqual([color(p) for p in ['sub/b.html', 'sub/deep/c.html', 'a.html']], ['blue/circle', 'green/circle', 'red/square'])
+
+        Path('src/other/_config.yaml').write_text('color: yellow\n')
+        updated = site.update('_output', False, ['src/other/_config.yaml'])
+        self.assertEqual([str(page.dstpath) for page in updated], ['other/d.html'])
+        self.assertEqual(color('other/d.html'), 'yellow/square')
+
+    def test_deleted_template(self):
+        # the template recorded by the last build is gone: the page is rebuilt with the default one
+        write_files({
+            '_templates/custom.j2.html': '{% extends "base.j2.html" %}{% block main %}<p id="custom">{{color}}</p>{% endblock %}',
+            'src/a.md': '---\ntemplate: custom.j2.html\ncolor: red\n---\n# a\n',
+        })
+        self.make_site().generate('_output', False)
+        self.assertIn('<p id="custom">red</p>', Path('_output/a.html').read_text())
+        Path('_templates/custom.j2.html').unlink()
+        Path('src/a.md').write_text('---\ncolor: red\n---\n# a\n')
+        stale = self.make_site().generate('_output', False)
+        self.assertEqual([str(page.dstpath) for page in stale], ['a.html'])
+        self.assertNotIn('id="custom"', Path('_output/a.html').read_text())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import json, unittest
+from pathlib import Path
+from sitegen.links import LinkGraph, resolve, extract_links
+from .helpers import SiteTestCase, write_files
+
+TEMPLATE = '{% extends "base.j2.html" %}{% block main %}{{body}}<p id="backlinks">{{backlinks|join(",")}}</p>{% endblock %}'
+
+class TestLinks(SiteTestCase):
+    def test_resolve(self):
+        self.assertEqual(resolve('a/b.html', '../c.html#x'), 'c.html')
+        self.assertEqual(resolve('a/b.html', 'sub/'), 'a/sub/index.html')
+        self.assertEqual(resolve('a/b.html', '.'), 'a/index.html')
+        self.assertEqual(resolve('a/b.html', '/d/e.html'), 'd/e.html')
+        self.assertEqual(resolve('a.html', 'c%20d.html?q=1'), 'c d.html')
+        for href in ['#top', 'http://example.com/a.html', 'mailto:a@example.com']:
+            self.assertIsNone(resolve('a.html', href))
+        self.assertEqual(extract_links('<a href="x.html">x</a><A class="c" HREF=\'y&amp;z.html\'>y</A><img src="i.png">'), ['x.html', 'y&z.html'])
+
+    def test_graph(self):
+        path = 'links.json'
+        g = LinkGraph(path)
+        self.assertEqual(g.set('a.html', [1], ['b.html', 'sub/', 'a.html', 'http://x/']), {'b.html', 'sub/index.html'})
+        self.assertEqual(g.set('sub/index.html', [2], ['../a.html', 'missing.html']), {'a.html', 'sub/missing.html'})
+        self.assertEqual(g.backlinks('b.html'), ['a.html'])
+        self.assertEqual(g.set('a.html', [3], ['b.html']), {'sub/index.html'})
+        self.assertEqual(g.report(['a.html', 'b.html', 'sub/index.html']), {'broken': [['sub/index.html', 'sub/missing.html']], 'orphans': []})
+        g.save()
+        g = LinkGraph(path)
+        self.assertEqual(g.links('a.html', [3]), ['b.html'])
+        self.assertIsNone(g.links('a.html', [4]))
+        self.assertEqual(g.prune(['b.html', 'sub/index.html']), {'b.html'})
+        self.assertEqual(g.backlinks('b.html'), [])
+
+    def test_backlinks(self):
+        write_files({
+            '_templates/markdown.j2.html': TEMPLATE,
+            'src/a.md': '# a\n\n[b](sub/b.html) [gone](nowhere.html)\n',
+            'src/sub/b.md': '# b\n\nno links\n',
+        })
+        site = self.make_site(link_report='report.json')
+        site.generate('_output', False)
+        self.assertIn('<p id="backlinks">../a.html</p>', Path('_output/sub/b.html').read_text())
+        self.assertEqual(json.loads(Path('report.json').read_text()), {'broken': [['a.html', 'nowhere.html']], 'orphans': ['a.html']})
+        self.assertEqual(site.generate('_output', False), [])
+
+        Path('src/a.md').write_text('# a\n\nno links any more\n')
+        updated = site.update('_output', False, ['src/a.md'])
+        self.assertEqual(sorted(str(page.dstpath) for page in updated), ['a.html', 'sub/b.html'])
+        self.assertIn('<p id="backlinks"></p>', Path('_output/sub/b.html').read_text())
+        self.assertEqual(json.loads(Path('report.json').read_text())['orphans'], ['a.html', 'sub/b.html'])
+
+if __name__ == '__main__':
+    unittest.main()
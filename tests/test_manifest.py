@@ -0,0 +1,64 @@
+import os, tempfile, unittest
+from pathlib import Path
+from unittest import mock
+from sitegen.manifest import Manifest, HashStamper, StatCache, stamp
+
+class TestManifest(unittest.TestCase):
+    def test_roundtrip(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'manifest.json')
+            m = Manifest(path)
+            self.assertIsNone(m.get(Path('a.html')))
+            m.set(Path('a.html'), {'source': stamp(path)})
+            m.set(Path('b.html'), {'source': [1, 2]})
+            m.prune([Path('b.html')])
+            m.save()
+            m = Manifest(path)
+            self.assertIsNone(m.get('a.html'))
+            self.assertEqual(m.get(Path('b.html')), {'source': [1, 2]})
+
+    def test_stamp(self):
+        with tempfile.TemporaryDirectory() as d:
+            self.assertIsNone(stamp(os.path.join(d, 'none')))
+            self.assertEqual(stamp(d)[0], os.stat(d).st_mtime_ns)
+
+    def test_stat_cache(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'a.md')
+            Path(path).write_text('a')
+            before, dirstat = os.stat(path), os.stat(d)
+            cache = StatCache()
+            with mock.patch('sitegen.manifest.os.stat', side_effect=os.stat) as st:
+                self.assertEqual(cache.stamp(path), [before.st_mtime_ns, 1])
+                self.assertEqual(cache.stat(Path(path)), before)
+                self.assertIsNone(cache.stat(os.path.join(d, 'none')))
+                self.assertIsNone(cache.stat(os.path.join(d, 'none')))
+                self.assertEqual(st.call_count, 2)
+                # written files are stat'ed again after invalidate
+                Path(path).write_text('abc')
+                self.assertEqual(cache.stat(path).st_size, 1)
+                cache.invalidate(Path(path))
+                self.assertEqual(cache.stat(path).st_size, 3)
+                cache.put(path, dirstat)
+                self.assertEqual(cache.stat(path), dirstat)
+                cache.clear()
+                self.assertEqual(cache.stat(path).st_size, 3)
+                self.assertEqual(st.call_count, 4)
+
+    def test_hash_stamper(self):
+        with tempfile.TemporaryDirectory() as d:
+            src = os.path.join(d, 'a.md')
+            index = os.path.join(d, 'hashes.json')
+            with open(src, 'w') as f:
+                f.write('hello')
+            h = HashStamper(index)
+            first = h.stamp(src)
+            h.save()
+            os.utime(src, (0, 0))
+            h = HashStamper(index)
+            self.assertEqual(h.stamp(src), first)
+            self.assertEqual(h.index[src]['stat'], stamp(src))
+            self.assertIsNone(h.stamp(os.path.join(d, 'none')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os, json, tempfile, unittest
+from collections import Counter
+from sitegen import profile
+from sitegen.profile import span
+from .helpers import SiteTestCase, write_files, linked_pages
+
+class TestProfile(unittest.TestCase):
+    def tearDown(self):
+        profile.stop()
+
+    def test_inactive(self):
+        with span('read', 'a.html'):
+            pass
+        self.assertIsNone(profile.active())
+
+    def test_summary(self):
+        p = profile.start()
+        with span('render-stage'):
+            for page in ['a.html', 'b.html']:
+                with span('page', page):
+                    with span('read', page):
+                        pass
+                    with span('render', page, size=3):
+                        pass
+        self.assertEqual(len(p.events), 7)
+        self.assertEqual(p.events[1]['args'], {'size': 3, 'page': 'a.html'})
+        lines = p.summary(workers=1)
+        self.assertEqual({l.split()[0] for l in lines[1:3]}, {'read', 'render'})
+        self.assertTrue(lines[-1].startswith('render stage:'))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'trace.json')
+            p.write(path)
+            with open(path) as f:
+                self.assertEqual(len(json.load(f)['traceEvents']), 7)
+
+    def test_drain(self):
+        p = profile.start()
+        with span('write', 'a.html'):
+            pass
+        events = p.drain()
+        self.assertEqual(p.events, [])
+        p.extend(events)
+        self.assertEqual(p.events[0]['name'], 'write')
+
+class TestProfileWorkers(SiteTestCase):
+    @unittest.skipUnless(hasattr(os, 'register_at_fork'), 'no fork')
+    def test_workers(self):
+        # spans recorded before the render workers were forked are not sent back by them
+        write_files(linked_pages(8))
+        p = profile.start()
+        self.addCleanup(profile.stop)
+        stale = self.make_site(jobs=2).generate('_output', False)
+        counts = Counter(e['name'] for e in p.events)
+        self.assertEqual((counts['scan'], counts['link-scan'], counts['page']), (1, 1, len(stale)))
+        self.assertEqual(len({json.dumps(e, sort_keys=True) for e in p.events}), len(p.events))
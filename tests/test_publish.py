@@ -0,0 +1,33 @@
+import os, tempfile, unittest
+from sitegen.publish import publish
+
+class TestPublish(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmp.name, 'src.js')
+        self.dst = os.path.join(self.tmp.name, 'dst.js')
+        with open(self.src, 'w') as f:
+            f.write('var x = 1;')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_modes(self):
+        for mode in ['copy', 'reflink', 'hardlink', 'symlink', 'copy']:
+            if mode == 'reflink':
+                os.remove(self.dst)
+            self.assertEqual(publish(self.src, self.dst, mode), mode)
+            self.assertIsNone(publish(self.src, self.dst, mode))
+            self.assertEqual(open(self.dst).read(), 'var x = 1;')
+            self.assertEqual(os.path.islink(self.dst), mode == 'symlink')
+            self.assertEqual(os.path.samefile(self.src, self.dst), mode in ('hardlink', 'symlink'))
+
+    def test_changed(self):
+        publish(self.src, self.dst)
+        with open(self.src, 'w') as f:
+            f.write('var x = 2;')
+        self.assertEqual(publish(self.src, self.dst), 'copy')
+        self.assertEqual(open(self.dst).read(), 'var x = 2;')
+
+if __name__ == '__main__':
+    unittest.main()
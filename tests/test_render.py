@@ -0,0 +1,87 @@
+import unittest, multiprocessing, concurrent.futures
+from unittest import mock
+from pathlib import Path
+from sitegen import sitegen
+from .helpers import SiteTestCase, write_files, linked_pages
+
+class TestRender(SiteTestCase):
+    def setUp(self):
+        super().setUp()
+        write_files(linked_pages(12))
+        self.site = self.make_site(jobs=2)
+        self.site.generate('_output', False)
+
+    def test_schedule(self):
+        pages = [page for page in self.site.pages if isinstance(page, sitegen.PageMarkdown)][:3]
+        manifest = self.site.manifest
+        manifest.set_duration(pages[0].dstpath, 1.0)
+        manifest.set_duration(pages[1].dstpath, 3.0)
+        manifest.durations.pop(pages[2].dstpath.as_posix(), None)
+        # unknown pages count as the average of the known ones
+        self.assertEqual(self.site.schedule(pages), [pages[1], pages[2], pages[0]])
+        manifest.set_duration(pages[2].dstpath, 2.5)
+        self.assertEqual(self.site.schedule(pages), [pages[1], pages[2], pages[0]])
+
+    def test_inflight(self):
+        # pages are submitted a few per worker ahead of the finished ones, not all at once
+        site = self.site
+        site.fork_workers = False
+        started = []
+        generate_page = sitegen.generate_page
+        def counted(i, dstdir, site=None):
+            started.append(i)
+            return generate_page(i, dstdir, site)
+        with mock.patch.object(sitegen, 'generate_page', counted):
+            results = site.render(site.pages, Path('_output'))
+            first = next(results)
+            self.assertLessEqual(len(started), site.jobs*sitegen.INFLIGHT_PER_JOB)
+            rest = list(results)
+        self.assertEqual(sorted(id(r[0]) for r in [first] + rest), sorted(id(page) for page in site.pages))
+        self.assertTrue(all(r[1] for r in [first] + rest))
+
+    def test_executor(self):
+        site = self.site
+        pages = [page for page in site.pages if isinstance(page, sitegen.PageMarkdown)]
+        def executors(pages):
+            with mock.patch('concurrent.futures.ProcessPoolExecutor', wraps=concurrent.futures.ProcessPoolExecutor) as processes, \
+                 mock.patch('concurrent.futures.ThreadPoolExecutor', wraps=concurrent.futures.ThreadPoolExecutor) as threads:
+                self.assertTrue(all(ok for page, ok, *rest in site.render(pages, Path('_output'))))
+            return processes.call_count, threads.call_count
+        if 'fork' in multiprocessing.get_all_start_methods():
+            self.assertEqual(executors(pages), (1, 0))
+        # fewer pages than workers, and watch mode: threads
+        self.assertEqual(executors(pages[:2]), (0, 1))
+        site.fork_workers = False
+        self.assertEqual(executors(pages), (0, 1))
+
+    def test_cache_counts(self):
+        # the link scan converts each page, the forked workers render it from the cache and their hits are counted
+        markdown = [page for page in self.site.pages if isinstance(page, sitegen.PageMarkdown)]
+        self.assertEqual((self.site.cache.hits, self.site.cache.misses), (len(markdown), len(markdown)))
+
+    def test_watch(self):
+        # rebuilds of watch mode render in threads, next to the watcher and the server
+        class Stop(Exception):
+            pass
+        with mock.patch('sitegen.watch.Watcher') as watcher, mock.patch('concurrent.futures.ProcessPoolExecutor', side_effect=AssertionError('forked')) as processes:
+            sources = [page.srcfile for page in self.site.pages if isinstance(page, sitegen.PageMarkdown)]
+            for f in sources:
+                Path(f).write_text('# edited\n')
+            watcher.return_value.wait.side_effect = [sources, Stop()]
+            with self.assertRaises(Stop):
+                self.site.watch('_output', False)
+        self.assertEqual(processes.call_count, 0)
+        self.assertIn('edited', Path('_output', sources[0].relative_to('src')).with_suffix('.html').read_text())
+
+class TestStream(SiteTestCase):
+    def test_no_cache(self):
+        # pages converted by the link scan are not converted again when their window is rendered
+        write_files(linked_pages(6))
+        with mock.patch.object(sitegen, 'STREAM_WINDOW', 2):
+            site = self.make_site(stream=True)
+            self.assertEqual(len(site.generate('_output', True)), len(site.pages))
+        self.assertEqual(len(self.pandoc.calls), 6)
+        self.assertEqual(list(site.cache.entries()), [])
+
+if __name__ == '__main__':
+    unittest.main()
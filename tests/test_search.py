@@ -0,0 +1,54 @@
+import io, os, json, tempfile, unittest
+from sitegen.search import NgramIndex, SearchEntries, write_searchindex, trigrams, fnv1a, SEARCH_DIR
+
+class TestNgramIndex(unittest.TestCase):
+    def test_trigrams(self):
+        g = trigrams('Abab日本語')
+        self.assertEqual(g['aba'.encode('utf-16-le')], [0])
+        self.assertEqual(g['b日本'.encode('utf-16-le')], [3])
+        self.assertEqual(len(trigrams('ab')), 0)
+
+    def test_fnv1a(self):
+        # same as the search page: 32bit fnv-1a over utf-16 code units
+        self.assertEqual(fnv1a(b''), 2166136261)
+        self.assertEqual(fnv1a('a'.encode('utf-16-le')), 0xe40c292c)
+
+    def test_write(self):
+        index = NgramIndex()
+        index.add('a.html', 'a', 'hello world')
+        index.add('b.html', 'b', 'worldwide')
+        with tempfile.TemporaryDirectory() as d:
+            os.makedirs(os.path.join(d, SEARCH_DIR))
+            open(os.path.join(d, SEARCH_DIR, 'ff.js'), 'w').close()
+            index.write(d)
+            files = sorted(os.listdir(os.path.join(d, SEARCH_DIR)))
+            self.assertEqual(files, ['0.js', 'docs.js'])
+            shard = open(os.path.join(d, SEARCH_DIR, '0.js')).read()
+            shard = json.loads(shard[shard.index('{'):-1])
+            self.assertEqual(shard['wor'], [[0, 6], [1, 0]])
+
+class TestSearchEntries(unittest.TestCase):
+    def test_reuse(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'search.json')
+            calls = []
+            def extract(content):
+                calls.append(content)
+                return {'url': 'a.html', 'title': 'a', 'content': content}
+            store = SearchEntries(path)
+            store.get('a.html', [1, 2], lambda: extract('one'))
+            store.save()
+            store = SearchEntries(path)
+            self.assertEqual(store.get('a.html', [1, 2], lambda: extract('two'))['content'], 'one')
+            self.assertEqual(store.get('a.html', [1, 3], lambda: extract('two'))['content'], 'two')
+            self.assertEqual(calls, ['one', 'two'])
+
+    def test_write_searchindex(self):
+        entries = [{'url': 'a.html', 'title': 'あ', 'content': 'x'}, {'url': 'b', 'title': 'b', 'content': ''}]
+        for e in (entries, []):
+            f = io.StringIO()
+            write_searchindex(f, iter(e))
+            self.assertEqual(f.getvalue(), f'var data={json.dumps(e)}')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os, json, filecmp, unittest
+from pathlib import Path
+from sitegen import sitegen
+from sitegen.shard import parse_shard, shard_of, read_shards
+from sitegen.links import LINKS_FILE
+from .helpers import SiteTestCase, write_files, linked_pages
+
+def files(d):
+    "relative paths of files under d, without hidden files"
+    return sorted(os.path.relpath(os.path.join(root, f), d) for root, dirs, fs in os.walk(d) for f in fs if not f.startswith('.'))
+
+class TestShard(SiteTestCase):
+    def test_parse(self):
+        self.assertEqual(parse_shard('2/4'), (2, 4))
+        for s in ['0/4', '5/4', '4', 'a/b']:
+            self.assertRaises(ValueError, parse_shard, s)
+
+    def test_shard_of(self):
+        paths = [Path(f'd{i%7}/p{i}.html') for i in range(200)]
+        shards = [shard_of(p, 4) for p in paths]
+        self.assertEqual(shards, [shard_of(Path(str(p)), 4) for p in paths])
+        self.assertEqual(set(shards), {1, 2, 3, 4})
+        self.assertEqual(shard_of('a/b.html', 1), 1)
+
+    def test_merge(self):
+        write_files(linked_pages(12, dirs=3))
+        def build(dstdir, shard=None):
+            self.make_site(compress=['gz'], shard=shard).generate(dstdir, True)
+
+        build('full')
+        for k in [1, 2, 3]:
+            build(f'shard{k}', (k, 3))
+        self.assertRaises(ValueError, sitegen.merge, ['shard1', 'shard2'], 'merged')
+        os.makedirs('merged')
+        Path('merged/abandoned.html').write_text('old')
+        sitegen.merge(['shard3', 'shard1', 'shard2'], 'merged')
+
+        shard_files = [set(files(f'shard{k}')) for k in [1, 2, 3]]
+        self.assertFalse(shard_files[0] & shard_files[1] or shard_files[1] & shard_files[2])
+        self.assertEqual([d.name for d, data in read_shards([Path('shard2'), Path('shard1'), Path('shard3')])], ['shard1', 'shard2', 'shard3'])
+        self.assertEqual(files('merged'), files('full'))
+        self.assertIn('searchindex.js.gz', files('merged'))
+        match, mismatch, errors = filecmp.cmpfiles('full', 'merged', files('full'), shallow=False)
+        self.assertEqual(mismatch + errors, [])
+        # the merged manifest makes the merged directory as fresh as a full build
+        self.assertEqual(self.make_site(compress=['gz']).generate('merged', True), [])
+
+    def test_links(self):
+        names = [f'p{i}' for i in range(8)]
+        write_files({
+            '_templates/markdown.j2.html': '{% extends "base.j2.html" %}{% block main %}{{body}}<p id="backlinks">{{backlinks|join(",")}}</p>{% endblock %}',
+            **{f'src/{name}.md': f'# {name}\n\n[next]({names[(i+1)%8]}.html) [third]({names[(i+3)%8]}.html)\n' for i, name in enumerate(names)},
+        })
+        def build(dstdir, shard=None, links_from=None):
+            self.pandoc.calls.clear()
+            site = self.make_site(shard=shard, links_from=links_from)
+            site.generate(dstdir, False)
+            return len([page for page in site.pages if isinstance(page, sitegen.PageMarkdown) and site.in_shard(page)])
+
+        build('full')
+        for k in [1, 2, 3]:
+            own = build(f'shard{k}', (k, 3))
+            # each page is converted once, for its links and its html
+            self.assertEqual(len(self.pandoc.calls), own)
+        sitegen.merge(['shard1', 'shard2', 'shard3'], 'merged')
+        self.assertEqual(json.loads(Path('merged', LINKS_FILE).read_text()), json.loads(Path('full', LINKS_FILE).read_text()))
+
+        # the next shard builds get the links of the other shards from the merged build
+        for k in [1, 2, 3]:
+            build(f'shard{k}', (k, 3), 'merged')
+        sitegen.merge(['shard1', 'shard2', 'shard3'], 'merged')
+        html = [f'{name}.html' for name in names]
+        match, mismatch, errors = filecmp.cmpfiles('full', 'merged', html, shallow=False)
+        self.assertEqual(match, html)
+
+if __name__ == '__main__':
+    unittest.main()
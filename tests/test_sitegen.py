@@ -18,6 +18,24 @@ class TestSitegen(unittest.TestCase):
         self.assertEqual(title, "This is title")
         self.assertEqual(toc, '<ul class="toc"><li><a href="#None"/></li><ul><li><a href="#None"/></li><ul><li><a href="#None"/></li></ul></ul><li><a href="#None"/></li><ul><ul><li><a href="#None"/></li></ul></ul></ul>')
 
+    def test_markdown_html(self):
+        a = """<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml">
+<head><title>This is title</title></head>
+<body>
+<h1 id="a">A &amp; B</h1>
+<h3 id="c">C <code>x</code></h3>
+<h2 id="b">B</h2>
+<h1 id="d"></h1>
+<p><a href="b.html">b</a> <a>none</a></p>
+</body>
+</html>"""
+        m = MarkdownHtml(a)
+        self.assertEqual(m.title, "This is title")
+        self.assertEqual(m.toc, '<li><a href="#a">A &amp; B</a></li>\n<ul><ul><li><a href="#c">C x</a></li>\n</ul><li><a href="#b">B</a></li>\n</ul><li><a href="#d"/></li>\n')
+        self.assertEqual(m.body.strip().splitlines()[0], '<h1 id="a">A &amp; B</h1>')
+        self.assertEqual(m.get_links(), ['b.html', None])
+
     def test_lm(self):
         a = """
 ---
@@ -30,5 +48,22 @@ others
         self.assertEqual(m, {'test':'path/to/directory', 'another':123})
         self.assertEqual(o.strip(), 'others')
 
+    def test_template_cache(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            tdir, cdir = Path(tmp)/'t', Path(tmp)/'c'
+            tdir.mkdir()
+            (tdir/'a.html').write_text('a {{ x }}')
+            engine = TemplateEngine(tdir, cdir)
+            self.assertEqual(engine.render('a.html', {'x': 1}), 'a 1')
+            self.assertTrue(any((cdir/TEMPLATE_CACHE_DIR).iterdir()))
+            mtime = (tdir/'a.html').stat().st_mtime
+            (tdir/'a.html').write_text('b {{ x }}')
+            os.utime(tdir/'a.html', (mtime+10, mtime+10))
+            self.assertEqual(engine.render('a.html', {'x': 1}), 'a 1')
+            engine.reset()
+            self.assertEqual(engine.render('a.html', {'x': 1}), 'b 1')
+            self.assertEqual(TemplateEngine(tdir, cdir).render('a.html', {'x': 2}), 'b 2')
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,36 @@
+import os, sys, tempfile, unittest, subprocess
+from unittest import mock
+from pathlib import Path
+from sitegen import sitegen
+from sitegen.supervisor import probe_cached
+
+class TestStartup(unittest.TestCase):
+    def test_lazy_imports(self):
+        code = 'import sys, sitegen.sitegen; print(sorted(m for m in ["jinja2", "yaml", "lxml", "tqdm"] if m in sys.modules))'
+        p = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, cwd=Path(__file__).resolve().parents[1], check=True)
+        self.assertEqual(p.stdout.decode().strip(), '[]')
+
+    def test_template_filename(self):
+        with tempfile.TemporaryDirectory() as d:
+            (Path(d)/'sub').mkdir()
+            for name in ['markdown.j2.html', 'sub/extra.html']:
+                (Path(d)/name).write_text('x')
+            engine = sitegen.TemplateEngine(d)
+            for name in ['markdown.j2.html', 'sub/extra.html', 'index.j2.html', './sub//extra.html']:
+                self.assertEqual(engine.filename(name), engine.env.loader.get_source(engine.env, name)[1])
+            self.assertIsNone(engine.filename('missing.html'))
+
+    def test_probe_cached(self):
+        calls = []
+        def probe():
+            calls.append(1)
+            return ['v', len(calls)]
+        with tempfile.TemporaryDirectory() as d, mock.patch.dict(os.environ, XDG_CACHE_HOME=d):
+            self.assertEqual(probe_cached('test', ['sh'], probe), ['v', 1])
+            self.assertEqual(probe_cached('test', ['sh'], probe), ['v', 1])
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(len(list(Path(d, 'sitegen').glob('probe-test-*.json'))), 1)
+            self.assertEqual(os.stat(Path(d, 'sitegen')).st_mode & 0o777, 0o700)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import time, shutil, unittest, threading
+from sitegen import sitegen
+from sitegen.supervisor import Supervisor, ConverterError
+
+@unittest.skipUnless(shutil.which('sh'), 'no sh')
+class TestSupervisor(unittest.TestCase):
+    def test_run(self):
+        s = Supervisor(timeout=10)
+        p = s.run(['sh', '-c', 'cat; echo warning >&2; exit 3'], b'in')
+        self.assertEqual((p.returncode, p.stdout, p.stderr), (3, b'in', b'warning\n'))
+        self.assertRaises(OSError, s.run, ['sitegen-no-such-command'])
+
+    def test_timeout(self):
+        s = Supervisor(timeout=0.2, retries=1)
+        start = time.time()
+        # the process group is killed, so the backgrounded sleep does not keep the pipes open
+        with self.assertRaises(ConverterError) as cm:
+            s.run(['sh', '-c', 'sleep 30 & wait'])
+        self.assertIn('timed out', str(cm.exception))
+        self.assertEqual((s.runs, s.timeouts), (2, 2))
+        # failed once, not run again
+        self.assertRaises(ConverterError, s.run, ['sh', '-c', 'sleep 30 & wait'])
+        self.assertEqual(s.runs, 2)
+        self.assertLess(time.time() - start, 10)
+
+    def test_killed(self):
+        s = Supervisor(retries=2)
+        with self.assertRaises(ConverterError) as cm:
+            s.run(['sh', '-c', 'echo crashed >&2; kill -9 $$'])
+        self.assertIn('killed by signal 9', str(cm.exception))
+        self.assertEqual(cm.exception.stderr, 'crashed')
+        self.assertEqual(s.runs, 3)
+
+    def test_max_procs(self):
+        s = Supervisor(max_procs=1)
+        start = time.time()
+        threads = [threading.Thread(target=s.run, args=(['sleep', '0.3'],)) for i in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertGreaterEqual(time.time() - start, 0.6)
+
+    def test_command_str(self):
+        self.assertEqual(sitegen.command_str(['sh', '-c', 'echo out; echo error >&2; exit 1']), ('out\n', 'error\n'))
+        self.assertEqual(sitegen.command_str(['sh', '-c', 'echo out; echo warning >&2']), ('out\n', ''))
+
+if __name__ == '__main__':
+    unittest.main()
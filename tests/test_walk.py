@@ -0,0 +1,78 @@
+import os, fnmatch, unittest
+from unittest import mock
+from pathlib import Path
+from sitegen import sitegen
+from .helpers import SiteTestCase, write_files
+
+FILES = ['a.md', 'a.md~', '#a.md#', '.hidden.md', 'sub/_', 'file_.md', '_config.yaml',
+         '_parts/p.md', '_/x.md', '.git/config', 'sub/b.md', 'sub/.cache/c.md', 'sub/deep/d.css', 'sub/x~/e.md']
+
+def glob_walk(basedir):
+    "the ignore rules of the walk, by fnmatch of every part below basedir"
+    def ignored(p):
+        return any(fnmatch.fnmatch(part, pattern) for pattern in sitegen.IGNORE_LIST for part in p.relative_to(basedir).parts)
+    return sorted((p.relative_to(basedir), p.is_dir()) for p in Path(basedir).glob('**/*') if not ignored(p))
+
+class TestWalk(SiteTestCase):
+    def setUp(self):
+        super().setUp()
+        write_files({f'src/{f}': f for f in FILES})
+
+    def test_ignore(self):
+        site = self.make_site()
+        walked = list(site.walk('src'))
+        self.assertEqual(sorted(walked), glob_walk('src'))
+        self.assertEqual(sorted(str(p) for p, is_dir in walked if not is_dir),
+                         ['_config.yaml', '_parts/p.md', 'a.md', 'file_.md', 'sub/b.md', 'sub/deep/d.css'])
+        # directories come before their contents
+        seen = set()
+        for p, is_dir in walked:
+            self.assertIn(p.parent, seen | {Path('.')})
+            if is_dir:
+                seen.add(p)
+        for p in ['_/x.md', 'sub/.cache', 'a.md~', 'sub/x~/e.md']:
+            self.assertTrue(site.is_ignored(Path(p)))
+        self.assertFalse(site.is_ignored(Path('_parts/p.md')))
+
+    def test_stats(self):
+        site = self.make_site()
+        sources = [page.srcfile for page in site.pages if not isinstance(page, sitegen.PageIndex)]
+        # the walk stat'ed the sources already
+        expected = [[os.stat(f).st_mtime_ns, os.stat(f).st_size] for f in sources]
+        with mock.patch('sitegen.manifest.os.stat', side_effect=os.stat) as stat:
+            self.assertEqual([site.stamper.stamp(f) for f in sources], expected)
+            self.assertEqual(stat.call_count, 0)
+            stat.reset_mock()
+            site.stats.invalidate(sources[0])
+            site.stamper.stamp(sources[0])
+            self.assertEqual(stat.call_count, 1)
+
+def scan_siblings(site, dstpath):
+    "siblings by a scan of all pages: pages of the directory and index pages of its subdirectories"
+    def is_sibling(a, b):
+        return a != b and (a.parent == b.parent or (a.parent == b.parent.parent and b.name == 'index.html'))
+    return {str(page.dstpath.relative_to(dstpath.parent)) for page in site.pages if is_sibling(dstpath, page.dstpath)}
+
+class TestSiblings(SiteTestCase):
+
+    def check(self, site):
+        for page in site.pages:
+            self.assertEqual(site.get_siblings(page.dstpath), scan_siblings(site, page.dstpath), page.dstpath)
+
+    def test_index(self):
+        write_files({f'src/{f}': '# x\n' for f in ['a.md', 'b.md', 'sub/c.md', 'sub/img.png', 'sub/deep/d.md', 'other/e.css']})
+        site = self.make_site()
+        site.generate('_output', False)
+        self.check(site)
+        self.assertEqual(site.get_siblings(Path('a.html')), {'b.html', 'sub/index.html', 'other/index.html'})
+
+        # pages added and removed
+        Path('src/b.md').unlink()
+        write_files({'src/sub/new.md': '# new\n', 'src/sub/x/y.md': '# y\n'})
+        site.update('_output', False, ['src/b.md', 'src/sub/new.md', 'src/sub/x/y.md'])
+        self.check(site)
+        self.assertEqual(site.get_siblings(Path('a.html')), {'sub/index.html', 'other/index.html'})
+        self.assertEqual(site.get_siblings(Path('sub/c.html')), {'new.html', 'img.png', 'index.html', 'deep/index.html', 'x/index.html'})
+
+if __name__ == '__main__':
+    unittest.main()
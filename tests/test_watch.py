@@ -0,0 +1,30 @@
+import os, sys, tempfile, unittest
+from pathlib import Path
+from sitegen.watch import PollingWatcher, InotifyWatcher
+
+class TestWatcher(unittest.TestCase):
+    def check(self, cls, **kw):
+        with tempfile.TemporaryDirectory() as d:
+            d = Path(d)
+            (d / 'sub').mkdir()
+            config = d / 'config.yaml'
+            w = cls([d / 'sub'], [config], **kw)
+            try:
+                (d / 'sub' / 'a.md').write_text('a')
+                self.assertIn(d / 'sub' / 'a.md', w.wait(timeout=2))
+                config.write_text('sitename: x')
+                self.assertIn(config, w.wait(timeout=2))
+                (d / 'other.txt').write_text('x')
+                self.assertEqual(w.wait(timeout=0.5), set())
+            finally:
+                w.close()
+
+    def test_polling(self):
+        self.check(PollingWatcher, interval=0.05)
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'inotify')
+    def test_inotify(self):
+        self.check(InotifyWatcher)
+
+if __name__ == '__main__':
+    unittest.main()